@@ -0,0 +1,191 @@
+"""Async serving mode.
+
+``ASGIBridge`` serves the Flask app from an asyncio event loop. Each request runs in its own
+greenlet through SQLAlchemy's asyncio bridge (the mechanism ``AsyncSession`` is built on),
+and the engines use asyncio drivers (asyncpg, aiosqlite; see ``async_driver_url``). Whenever
+a handler waits on the database, the connection pool or the client socket, its greenlet
+yields to the loop, so one process can hold thousands of connections open while every
+handler, with its validation and ``jwt_required`` checks, keeps its synchronous code.
+
+Anything else that blocks inside a handler blocks the whole loop; use ``wait_future`` for
+work handed off to an executor.
+"""
+import asyncio
+import io
+import sys
+import threading
+from sqlalchemy.engine import make_url
+from sqlalchemy.util import await_only, greenlet_spawn
+from sqlalchemy.util.concurrency import in_greenlet
+
+ASYNC_DRIVERS = {
+    'postgresql': 'postgresql+asyncpg',
+    'postgresql+psycopg2': 'postgresql+asyncpg',
+    'sqlite': 'sqlite+aiosqlite',
+    'sqlite+pysqlite': 'sqlite+aiosqlite',
+    'mysql': 'mysql+aiomysql',
+    'mysql+pymysql': 'mysql+aiomysql',
+}
+
+
+def async_driver_url(url):
+    """Return ``url`` with its DBAPI driver swapped for the asyncio equivalent"""
+    parsed = make_url(url)
+    drivername = ASYNC_DRIVERS.get(parsed.drivername, parsed.drivername)
+    return parsed.set(drivername=drivername).render_as_string(hide_password=False)
+
+
+def wait_future(future, timeout=None):
+    """``future.result(timeout)`` that yields to the event loop when running under the bridge"""
+    if in_greenlet():
+        return await_only(asyncio.wait_for(asyncio.wrap_future(future), timeout))
+    return future.result(timeout=timeout)
+
+
+class Signal:
+    """One-shot wake-up flag, set from any thread and waited on by a thread or a bridged greenlet"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._set = False
+        self._waiter = None
+
+    def set(self):
+        with self._lock:
+            self._set = True
+            waiter = self._waiter
+        if waiter is not None:
+            loop, event = waiter
+            if loop is None:
+                event.set()
+            else:
+                loop.call_soon_threadsafe(event.set)
+
+    def wait(self, timeout):
+        """Wait up to ``timeout`` seconds; returns (and clears) whether the signal was set"""
+        with self._lock:
+            if not self._set:
+                if in_greenlet():
+                    self._waiter = (asyncio.get_running_loop(), asyncio.Event())
+                else:
+                    self._waiter = (None, threading.Event())
+            waiter = self._waiter
+        try:
+            if waiter is not None:
+                loop, event = waiter
+                if loop is None:
+                    event.wait(timeout)
+                else:
+                    try:
+                        await_only(asyncio.wait_for(event.wait(), timeout))
+                    except asyncio.TimeoutError:
+                        pass
+        finally:
+            with self._lock:
+                was_set, self._set, self._waiter = self._set, False, None
+        return was_set
+
+
+def _environ(scope, body):
+    server = scope.get('server') or ('localhost', 80)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', '').encode('utf-8').decode('latin-1'),
+        'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+        'QUERY_STRING': scope['query_string'].decode('latin-1'),
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1] or 80),
+        'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+        'REMOTE_ADDR': scope['client'][0] if scope.get('client') else '',
+        'CONTENT_LENGTH': str(len(body)),
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': io.BytesIO(body),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': False,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+    }
+    for name, value in scope['headers']:
+        name = name.decode('latin-1').upper().replace('-', '_')
+        value = value.decode('latin-1')
+        if name == 'CONTENT_LENGTH':
+            continue
+        key = name if name == 'CONTENT_TYPE' else f'HTTP_{name}'
+        environ[key] = f'{environ[key]},{value}' if key in environ else value
+    return environ
+
+
+class ASGIBridge:
+    """ASGI application running a WSGI app in per-request greenlets"""
+
+    def __init__(self, wsgi_app, max_body_size=64 * 1024 * 1024):
+        self.wsgi_app = wsgi_app
+        self.max_body_size = max_body_size
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            while True:
+                message = await receive()
+                await send({'type': message['type'] + '.complete'})
+                if message['type'] == 'lifespan.shutdown':
+                    return
+        if scope['type'] != 'http':
+            return
+
+        chunks, size = [], 0
+        while True:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                return
+            chunks.append(message.get('body', b''))
+            size += len(chunks[-1])
+            if size > self.max_body_size:
+                await send({'type': 'http.response.start', 'status': 413, 'headers': []})
+                await send({'type': 'http.response.body', 'body': b''})
+                return
+            if not message.get('more_body'):
+                break
+        disconnected = asyncio.Event()
+
+        async def watch_disconnect():
+            while (await receive())['type'] != 'http.disconnect':
+                pass
+            disconnected.set()
+
+        watcher = asyncio.ensure_future(watch_disconnect())
+        try:
+            await greenlet_spawn(self._handle, scope, b''.join(chunks), send, disconnected)
+        finally:
+            watcher.cancel()
+
+    def _handle(self, scope, body, send, disconnected):
+        response_start = {}
+
+        def start_response(status, headers, exc_info=None):
+            response_start.update(
+                type='http.response.start',
+                status=int(status.split(' ', 1)[0]),
+                headers=[(name.lower().encode('latin-1'), value.encode('latin-1')) for name, value in headers]
+            )
+
+        result = self.wsgi_app(_environ(scope, body), start_response)
+        try:
+            # everything, including streamed bodies, is produced inside this greenlet
+            started = False
+            for chunk in result:
+                if disconnected.is_set():
+                    # stop long-lived streams once the client has gone
+                    return
+                if not chunk:
+                    continue
+                if not started:
+                    await_only(send(response_start))
+                    started = True
+                await_only(send({'type': 'http.response.body', 'body': chunk, 'more_body': True}))
+            if not started:
+                await_only(send(response_start))
+            await_only(send({'type': 'http.response.body', 'body': b''}))
+        finally:
+            if hasattr(result, 'close'):
+                result.close()
@@ -0,0 +1,94 @@
+"""Hot/cold archival of completed tasks.
+
+``flask archive-tasks`` moves completed tasks whose due date is more than
+``ARCHIVE_AFTER_DAYS`` in the past from ``tasks`` into ``tasks_archive``, in batches of
+``ARCHIVE_BATCH_SIZE`` found through the (status, due_date) index. With ``--interval`` it
+keeps running as a background worker; run a single archiver at a time.
+
+Listings and exports read the archive only with ``include_archived=true``, so the hot table
+and its indexes hold the working set; GET /tasks/<id> falls back to it. Archived tasks still
+count in ``/tasks/stats`` and can be deleted, singly or in bulk, but updating one is a 409.
+They leave the search index, and delta sync reports them as deleted, so synced clients
+mirror the default listing.
+"""
+import datetime
+import time
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from models import ArchivedTask, Task, db
+from search import unindex_tasks
+from shards import shard_router
+import sync
+
+DEFAULT_ARCHIVE_AFTER_DAYS = 90
+DEFAULT_BATCH_SIZE = 1000
+ARCHIVED_COLUMNS = (
+    'id', 'title', 'description', 'due_date', 'priority', 'priority_rank', 'status', 'user_id', 'version', 'created_version'
+)
+
+
+def with_archive(user_id):
+    """Subquery over the user's hot and archived tasks, for ``GET /tasks?include_archived=true``"""
+    return db.union_all(
+        db.select(*[getattr(Task, name) for name in ARCHIVED_COLUMNS]).where(Task.user_id == user_id),
+        db.select(*[getattr(ArchivedTask, name) for name in ARCHIVED_COLUMNS]).where(ArchivedTask.user_id == user_id)
+    ).subquery('tasks_with_archive')
+
+
+def archive_batch(cutoff, batch_size=DEFAULT_BATCH_SIZE):
+    """Move up to ``batch_size`` completed tasks due before ``cutoff``; returns how many moved"""
+    eligible = db.and_(Task.status == db.true(), Task.due_date < cutoff)
+    candidates = db.session.execute(
+        db.select(Task.id, Task.user_id).where(eligible).order_by(Task.due_date, Task.id).limit(batch_size)
+    ).all()
+    if not candidates:
+        return 0
+
+    # user rows first, like the task handlers, then re-check the tasks under those locks
+    versions = sync.bump_versions(sorted({user_id for _, user_id in candidates}))
+    moved = db.session.execute(
+        db.delete(Task).where(Task.id.in_([task_id for task_id, _ in candidates]), eligible)
+        .returning(*[getattr(Task, name) for name in ARCHIVED_COLUMNS]),
+        execution_options={"synchronize_session": False}
+    ).all()
+    if moved:
+        db.session.execute(db.insert(ArchivedTask), [row._asdict() for row in moved])
+        by_user = {}
+        for row in moved:
+            by_user.setdefault(row.user_id, []).append(row.id)
+        for user_id, task_ids in by_user.items():
+            unindex_tasks(user_id, task_ids)
+            sync.record_deletes(user_id, task_ids, versions[user_id])
+    db.session.commit()
+    return len(moved)
+
+
+def archive(days=None, batch_size=None):
+    """Archive every eligible task, one committed batch at a time; returns the total moved"""
+    if days is None:
+        days = current_app.config.get('ARCHIVE_AFTER_DAYS', DEFAULT_ARCHIVE_AFTER_DAYS)
+    if batch_size is None:
+        batch_size = current_app.config.get('ARCHIVE_BATCH_SIZE', DEFAULT_BATCH_SIZE)
+    cutoff = datetime.date.today() - datetime.timedelta(days=days)
+    total = 0
+    while True:
+        moved = archive_batch(cutoff, batch_size)
+        total += moved
+        if moved < batch_size:
+            return total
+
+
+@click.command('archive-tasks')
+@click.option('--days', type=int, default=None, help='Archive tasks due more than this many days ago (default: ARCHIVE_AFTER_DAYS).')
+@click.option('--batch-size', type=int, default=None, help='Tasks moved per transaction (default: ARCHIVE_BATCH_SIZE).')
+@click.option('--interval', type=int, default=0, help='Keep running, archiving every this many seconds.')
+@with_appcontext
+def archive_tasks_command(days, batch_size, interval):
+    """Move old completed tasks into tasks_archive."""
+    while True:
+        count = sum(archive(days, batch_size) for _ in shard_router.each_shard())
+        click.echo(f"Archived {count} task(s).")
+        if not interval:
+            return
+        time.sleep(interval)
@@ -0,0 +1,10 @@
+"""ASGI entry point for the async serving mode, e.g.
+
+    hypercorn asgi:application --bind 0.0.0.0:8000
+
+Same routes and configuration as app.py, with the database reached through asyncio drivers.
+"""
+from aio import ASGIBridge
+from app import create_app
+
+application = ASGIBridge(create_app({'SQLALCHEMY_ASYNC': True}))
@@ -0,0 +1,490 @@
+"""Benchmark and load-test driver for the task API.
+
+Seeds synthetic users and tasks, then drives every blueprint endpoint (auth, tasks, profile)
+with concurrent clients, either in-process through the Flask test client or over HTTP against
+a threaded local server. For each scenario it reports throughput, p50/p95/p99 latency and SQL
+statements per request, writes the results as JSON and can fail on regressions against a
+saved baseline. GET /tasks/events never ends, so it is timed to the first chunk of its stream.
+
+    python -m benchmarks.run --scale 1k
+    python -m benchmarks.run --scale 100k --mode http --concurrency 16 --output results.json
+    python -m benchmarks.run --scale 1k --baseline benchmarks/results/baseline.json --max-regression 0.2
+
+By default a throwaway SQLite file is used; pass --database-url to benchmark PostgreSQL.
+"""
+import argparse
+import collections
+import datetime
+import http.client
+import itertools
+import json
+import logging
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+SEARCH_TERMS = ('report', 'budget review', 'release', 'customer meeting', 'security')
+EXPECTED_OK = frozenset([200, 201, 304])
+
+
+class Scenario:
+    def __init__(self, name, blueprint, method, build, setup=None, config=None, first_chunk=False):
+        self.name = name
+        self.blueprint = blueprint
+        self.method = method
+        self.build = build
+        self.setup = setup
+        # app config overrides while the scenario runs
+        self.config = config or {}
+        # only read the first chunk of the body, for endless streams such as /tasks/events
+        self.first_chunk = first_chunk
+
+
+class Context:
+    """Seeded users with tokens and task ids, shared by all workers"""
+
+    def __init__(self, run_id, users):
+        self.run_id = run_id
+        self.users = users
+        self.sequence = itertools.count()
+        self.deletable = collections.deque()
+
+
+def _task_body(rng):
+    return {
+        "title": f"Benchmark task {rng.randint(0, 10 ** 6)}",
+        "description": "created by the benchmark suite",
+        "due_date": (datetime.date.today() + datetime.timedelta(days=rng.randint(0, 90))).isoformat(),
+        "priority": rng.choice(["High", "Medium", "Low"]),
+        "status": False
+    }
+
+
+def _prepare_deletable(ctx, count, per_request):
+    """Create tasks up front so the delete scenarios have something to remove"""
+    from flask import current_app
+    # through the public bulk endpoint, so versions, task_stats and the search index stay consistent
+    client = current_app.test_client()
+    rng = random.Random(7)
+    ctx.deletable.clear()
+    for _ in range(count):
+        user = rng.choice(ctx.users)
+        response = client.post('/tasks/bulk', headers={"Authorization": f"Bearer {user['token']}"},
+                               json=[_task_body(rng) for _ in range(per_request)])
+        if response.status_code != 200 or response.json['failed']:
+            raise RuntimeError(f"seeding tasks to delete failed: {response.status_code} {response.get_data(as_text=True)}")
+        ctx.deletable.append((user, [result['id'] for result in response.json['results']]))
+
+
+def _pop_deletable(ctx):
+    try:
+        return ctx.deletable.popleft()
+    except IndexError:
+        return ctx.users[0], [0]
+
+
+def scenarios():
+    def user(ctx, rng):
+        return rng.choice(ctx.users)
+
+    def auth(u):
+        return {"Authorization": f"Bearer {u['token']}"}
+
+    def register(ctx, rng):
+        n = next(ctx.sequence)
+        email = f"bench-{ctx.run_id}-new-{n}@example.com"
+        return "/register", None, {"username": f"new{n}", "email": email, "password": "benchmark-password"}
+
+    def login(ctx, rng):
+        return "/login", None, {"email": user(ctx, rng)['email'], "password": "benchmark-password"}
+
+    def get(path_fn):
+        def build(ctx, rng):
+            u = user(ctx, rng)
+            return path_fn(u, rng), auth(u), None
+        return build
+
+    def create(ctx, rng):
+        return "/tasks", auth(user(ctx, rng)), _task_body(rng)
+
+    def update(ctx, rng):
+        u = user(ctx, rng)
+        return f"/tasks/{rng.choice(u['task_ids'])}", auth(u), {"status": rng.random() < 0.5}
+
+    def delete(ctx, rng):
+        u, ids = _pop_deletable(ctx)
+        return f"/tasks/{ids[0]}", auth(u), None
+
+    def bulk_create(ctx, rng):
+        return "/tasks/bulk", auth(user(ctx, rng)), [_task_body(rng) for _ in range(100)]
+
+    def bulk_update(ctx, rng):
+        u = user(ctx, rng)
+        return "/tasks/bulk", auth(u), [{"id": task_id, "status": rng.random() < 0.5} for task_id in u['task_ids']]
+
+    def bulk_delete(ctx, rng):
+        u, ids = _pop_deletable(ctx)
+        return "/tasks/bulk", auth(u), ids
+
+    def changes_since_seed(ctx, rng):
+        from sync import encode_token
+        u = user(ctx, rng)
+        return f"/tasks/changes?since={encode_token(0)}", auth(u), None
+
+    return [
+        Scenario("landing", "app", "GET", lambda ctx, rng: ("/", None, None)),
+        Scenario("register", "auth", "POST", register),
+        Scenario("login", "auth", "POST", login),
+        Scenario("list_all", "tasks", "GET", get(lambda u, rng: "/tasks")),
+        Scenario("list_page", "tasks", "GET", get(lambda u, rng: "/tasks?limit=50")),
+        Scenario("list_filtered_sorted", "tasks", "GET",
+                 get(lambda u, rng: "/tasks?status=false&sort_by=priority&order=desc&limit=50")),
+        Scenario("list_sparse_fields", "tasks", "GET", get(lambda u, rng: "/tasks?fields=id,title,due_date&limit=100")),
+        Scenario("list_columnar", "tasks", "GET", get(lambda u, rng: "/tasks?format=columnar&limit=100")),
+        Scenario("get_task", "tasks", "GET", get(lambda u, rng: f"/tasks/{rng.choice(u['task_ids'])}")),
+        Scenario("stats", "tasks", "GET", get(lambda u, rng: "/tasks/stats")),
+        Scenario("search", "tasks", "GET", get(lambda u, rng: f"/tasks/search?q={rng.choice(SEARCH_TERMS).replace(' ', '+')}&limit=20")),
+        Scenario("export", "tasks", "GET", get(lambda u, rng: "/tasks/export?format=ndjson")),
+        Scenario("create_task", "tasks", "POST", create),
+        Scenario("create_task_group_commit", "tasks", "POST", create, config={"TASK_GROUP_COMMIT": True}),
+        Scenario("update_task", "tasks", "PUT", update),
+        Scenario("delete_task", "tasks", "DELETE", delete, setup=lambda ctx, n: _prepare_deletable(ctx, n, 1)),
+        Scenario("bulk_create", "tasks", "POST", bulk_create),
+        Scenario("bulk_update", "tasks", "PUT", bulk_update),
+        Scenario("bulk_delete", "tasks", "DELETE", bulk_delete, setup=lambda ctx, n: _prepare_deletable(ctx, n, 100)),
+        # after the writes above, so there is something to sync
+        Scenario("changes_full", "tasks", "GET", get(lambda u, rng: "/tasks/changes")),
+        Scenario("changes_since_seed", "tasks", "GET", changes_since_seed),
+        Scenario("events_connect", "tasks", "GET", get(lambda u, rng: "/tasks/events"), first_chunk=True),
+        Scenario("profile", "profile", "GET", get(lambda u, rng: "/profile")),
+        Scenario("feature", "profile", "GET", lambda ctx, rng: ("/feature", None, None)),
+    ]
+
+
+class SqlCounter:
+    def __init__(self):
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, *args):
+        with self._lock:
+            self.count += 1
+
+
+class InProcessClient:
+    def __init__(self, app):
+        self._client = app.test_client()
+
+    def request(self, method, path, headers, body, first_chunk=False):
+        if first_chunk:
+            response = self._client.open(path, method=method, headers=headers, json=body, buffered=False)
+            next(iter(response.response), None)
+            response.close()
+            return response.status_code
+        response = self._client.open(path, method=method, headers=headers, json=body)
+        response.get_data()
+        return response.status_code
+
+    def close(self):
+        pass
+
+
+class HttpClient:
+    def __init__(self, host, port):
+        self._connection = http.client.HTTPConnection(host, port, timeout=60)
+
+    def request(self, method, path, headers, body, first_chunk=False):
+        headers = dict(headers or {})
+        payload = None
+        if body is not None:
+            payload = json.dumps(body).encode('utf-8')
+            headers['Content-Type'] = 'application/json'
+        self._connection.request(method, path, body=payload, headers=headers)
+        response = self._connection.getresponse()
+        if first_chunk:
+            response.readline()
+            # the rest never ends; the next request reconnects
+            self._connection.close()
+            return response.status
+        response.read()
+        return response.status
+
+    def close(self):
+        self._connection.close()
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, int(round(fraction * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[index]
+
+
+def run_scenario(scenario, ctx, make_client, sql_counter, requests, concurrency):
+    latencies = []
+    errors = collections.Counter()
+    lock = threading.Lock()
+    per_worker = [requests // concurrency + (1 if i < requests % concurrency else 0) for i in range(concurrency)]
+
+    def worker(count, seed):
+        rng = random.Random(seed)
+        client = make_client()
+        local = []
+        try:
+            for _ in range(count):
+                path, headers, body = scenario.build(ctx, rng)
+                started = time.perf_counter()
+                try:
+                    status = client.request(scenario.method, path, headers, body, scenario.first_chunk)
+                except Exception as e:
+                    status = type(e).__name__
+                local.append(time.perf_counter() - started)
+                if status not in EXPECTED_OK:
+                    with lock:
+                        errors[str(status)] += 1
+        finally:
+            client.close()
+        with lock:
+            latencies.extend(local)
+
+    sql_before = sql_counter.count
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(worker, per_worker, range(concurrency)))
+    elapsed = time.perf_counter() - started
+    statements = sql_counter.count - sql_before
+
+    latencies.sort()
+    ms = [value * 1000 for value in latencies]
+    return {
+        "name": scenario.name,
+        "blueprint": scenario.blueprint,
+        "requests": len(latencies),
+        "errors": dict(errors),
+        "throughput_rps": round(len(latencies) / elapsed, 2) if elapsed else 0.0,
+        "mean_ms": round(sum(ms) / len(ms), 3) if ms else 0.0,
+        "p50_ms": round(percentile(ms, 0.50), 3),
+        "p95_ms": round(percentile(ms, 0.95), 3),
+        "p99_ms": round(percentile(ms, 0.99), 3),
+        "sql_per_request": round(statements / len(latencies), 3) if latencies else 0.0,
+    }
+
+
+def compare(results, baseline, max_regression):
+    """Regressions of ``results`` against ``baseline`` as human-readable strings"""
+    failures = []
+    previous = {scenario['name']: scenario for scenario in baseline.get('scenarios', [])}
+    for scenario in results['scenarios']:
+        old = previous.get(scenario['name'])
+        if old is None:
+            continue
+        name = scenario['name']
+        if old['p95_ms'] and scenario['p95_ms'] > old['p95_ms'] * (1 + max_regression):
+            failures.append(f"{name}: p95 {old['p95_ms']:.2f}ms -> {scenario['p95_ms']:.2f}ms")
+        if old['throughput_rps'] and scenario['throughput_rps'] < old['throughput_rps'] * (1 - max_regression):
+            failures.append(f"{name}: throughput {old['throughput_rps']:.1f} -> {scenario['throughput_rps']:.1f} req/s")
+        if scenario['sql_per_request'] > old['sql_per_request'] + 0.05:
+            failures.append(f"{name}: SQL/request {old['sql_per_request']} -> {scenario['sql_per_request']}")
+        if scenario['errors'] and not old['errors']:
+            failures.append(f"{name}: new errors {scenario['errors']}")
+    return failures
+
+
+def _git_revision():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], stderr=subprocess.DEVNULL, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def build_app(database_url):
+    from app import create_app
+    from models import db
+    app = create_app({'SQLALCHEMY_DATABASE_URI': database_url})
+    with app.app_context():
+        db.create_all()
+    return app
+
+
+COLD_START_SCRIPT = '''
+import json, sys, time
+started = time.perf_counter()
+from app import create_app
+imported = time.perf_counter()
+app = create_app({'SQLALCHEMY_DATABASE_URI': sys.argv[1]})
+created = time.perf_counter()
+app.test_client().get('/feature')
+served = time.perf_counter()
+print(json.dumps({"import_ms": (imported - started) * 1000, "create_app_ms": (created - imported) * 1000,
+                  "first_request_ms": (served - created) * 1000}))
+'''
+
+
+def measure_cold_start(database_url, runs):
+    """Median worker boot times over ``runs`` fresh interpreters"""
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    samples = collections.defaultdict(list)
+    for _ in range(runs):
+        started = time.perf_counter()
+        output = subprocess.run(
+            [sys.executable, '-c', COLD_START_SCRIPT, database_url],
+            cwd=root, check=True, capture_output=True, text=True
+        ).stdout
+        samples['process_ms'].append((time.perf_counter() - started) * 1000)
+        for key, value in json.loads(output.strip().splitlines()[-1]).items():
+            samples[key].append(value)
+    return {key: round(sorted(values)[len(values) // 2], 1) for key, values in samples.items()}
+
+
+def _serve(app):
+    from werkzeug.serving import WSGIRequestHandler, make_server
+
+    class KeepAliveHandler(WSGIRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    server = make_server('127.0.0.1', 0, app, threaded=True, request_handler=KeepAliveHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server
+
+
+def print_table(results):
+    header = f"{'scenario':<22}{'req/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'sql/req':>9}  errors"
+    print(header)
+    print('-' * len(header))
+    for s in results['scenarios']:
+        errors = ', '.join(f"{k}x{v}" for k, v in s['errors'].items()) or '-'
+        print(f"{s['name']:<22}{s['throughput_rps']:>10.1f}{s['p50_ms']:>10.2f}{s['p95_ms']:>10.2f}"
+              f"{s['p99_ms']:>10.2f}{s['sql_per_request']:>9.2f}  {errors}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--scale', choices=['1k', '100k', '1m'], default='1k')
+    parser.add_argument('--mode', choices=['inprocess', 'http'], default='inprocess')
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--requests', type=int, default=200, help='requests per scenario')
+    parser.add_argument('--warmup', type=int, default=20, help='unmeasured requests per scenario')
+    parser.add_argument('--scenarios', default='', help='comma-separated scenario names (default: all)')
+    parser.add_argument('--database-url', help='database to seed and benchmark (default: a temporary SQLite file)')
+    parser.add_argument('--output', help='where to write the JSON results (default: benchmarks/results/<scale>-<mode>.json)')
+    parser.add_argument('--baseline', help='JSON results to compare against')
+    parser.add_argument('--max-regression', type=float, default=0.2, help='allowed relative p95/throughput regression')
+    parser.add_argument('--cold-start-runs', type=int, default=5, help='fresh interpreters to time app startup in (0 to skip)')
+    args = parser.parse_args(argv)
+
+    tmpdir = None
+    database_url = args.database_url
+    if not database_url:
+        tmpdir = tempfile.mkdtemp(prefix='task-bench-')
+        database_url = f"sqlite:///{os.path.join(tmpdir, 'bench.db')}"
+
+    cold_start = measure_cold_start(database_url, args.cold_start_runs) if args.cold_start_runs else None
+    app = build_app(database_url)
+    from sqlalchemy import event
+    from models import db
+    from utils import create_access_token
+    from benchmarks import seed as seeding
+
+    run_id = uuid.uuid4().hex[:8]
+    sql_counter = SqlCounter()
+    with app.app_context():
+        seed_started = time.perf_counter()
+        seeded = seeding.seed(args.scale, run_id)
+        seed_seconds = time.perf_counter() - seed_started
+        user_ids = [user_id for user_id, _ in seeded]
+        from models import Task
+        task_ids = {}
+        for user_id in user_ids:
+            task_ids[user_id] = db.session.scalars(
+                db.select(Task.id).where(Task.user_id == user_id).order_by(Task.id).limit(100)
+            ).all()
+        with app.test_request_context():
+            users = [
+                {"id": user_id, "email": email, "task_ids": task_ids[user_id],
+                 "token": create_access_token(identity=email, user_id=user_id)}
+                for user_id, email in seeded
+            ]
+        for engine in db.engines.values():
+            event.listen(engine, 'before_cursor_execute', sql_counter)
+    ctx = Context(run_id, users)
+
+    server = None
+    if args.mode == 'http':
+        server = _serve(app)
+        make_client = lambda: HttpClient('127.0.0.1', server.server_port)
+    else:
+        make_client = lambda: InProcessClient(app)
+
+    selected = [name for name in args.scenarios.split(',') if name]
+    results = {
+        "meta": {
+            "scale": args.scale,
+            "mode": args.mode,
+            "concurrency": args.concurrency,
+            "requests_per_scenario": args.requests,
+            "database": database_url.split(':', 1)[0],
+            "seed_seconds": round(seed_seconds, 2),
+            "cold_start": cold_start,
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "git_revision": _git_revision(),
+            "timestamp": datetime.datetime.utcnow().isoformat() + 'Z',
+        },
+        "scenarios": [],
+    }
+    try:
+        for scenario in scenarios():
+            if selected and scenario.name not in selected:
+                continue
+            if scenario.setup:
+                with app.app_context():
+                    scenario.setup(ctx, args.requests + args.warmup)
+            previous = {key: app.config.get(key) for key in scenario.config}
+            app.config.update(scenario.config)
+            try:
+                if args.warmup:
+                    run_scenario(scenario, ctx, make_client, sql_counter, args.warmup, min(args.concurrency, args.warmup))
+                results["scenarios"].append(
+                    run_scenario(scenario, ctx, make_client, sql_counter, args.requests, args.concurrency)
+                )
+            finally:
+                app.config.update(previous)
+    finally:
+        if server is not None:
+            server.shutdown()
+
+    output = args.output or os.path.join('benchmarks', 'results', f"{args.scale}-{args.mode}.json")
+    os.makedirs(os.path.dirname(output) or '.', exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print_table(results)
+    if cold_start:
+        print("\ncold start (median ms): " + ', '.join(f"{key} {value}" for key, value in cold_start.items()))
+    print(f"\nresults written to {output}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if (baseline['meta'].get('scale'), baseline['meta'].get('mode')) != (args.scale, args.mode):
+            print("warning: baseline was recorded with a different scale or mode", file=sys.stderr)
+        failures = compare(results, baseline, args.max_regression)
+        if failures:
+            print("\nregressions against baseline:", file=sys.stderr)
+            for failure in failures:
+                print(f"  {failure}", file=sys.stderr)
+            return 1
+        print("no regressions against baseline")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,75 @@
+"""Synthetic users and tasks for the benchmark suite.
+
+Rows are written with multi-row core INSERTs in large chunks, then the derived tables
+(task_stats and, for the built-in backend, the search index) are rebuilt in one pass.
+"""
+import datetime
+import random
+from werkzeug.security import generate_password_hash
+from models import PRIORITY_RANKS, Task, User, db
+import search
+import stats
+
+SCALES = {
+    '1k': (10, 100),
+    '100k': (100, 1000),
+    '1m': (200, 5000),
+}
+PASSWORD = 'benchmark-password'
+WORDS = ('report', 'invoice', 'review', 'deploy', 'meeting', 'budget', 'design', 'release',
+         'customer', 'planning', 'backlog', 'migration', 'security', 'roadmap', 'hiring')
+CHUNK_SIZE = 10000
+
+
+def _task_rows(rng, user_id, count, today):
+    priorities = list(PRIORITY_RANKS)
+    for _ in range(count):
+        priority = rng.choice(priorities)
+        yield {
+            "title": ' '.join(rng.sample(WORDS, 3)).capitalize(),
+            "description": ' '.join(rng.choices(WORDS, k=12)),
+            "due_date": today + datetime.timedelta(days=rng.randint(-180, 365)),
+            "priority": priority,
+            "priority_rank": PRIORITY_RANKS[priority],
+            "status": rng.random() < 0.4,
+            "user_id": user_id
+        }
+
+
+def seed(scale, run_id, rng_seed=42):
+    """Create the users and tasks for ``scale``; returns a list of (user_id, email)"""
+    users_count, tasks_per_user = SCALES[scale]
+    rng = random.Random(rng_seed)
+    password_hash = generate_password_hash(PASSWORD)
+    users = [
+        {"username": f"bench{i}", "email": f"bench-{run_id}-{i}@example.com", "password": password_hash}
+        for i in range(users_count)
+    ]
+    user_ids = db.session.scalars(
+        db.insert(User).returning(User.id, sort_by_parameter_order=True), users
+    ).all()
+
+    today = datetime.date.today()
+    batch = []
+    for user_id in user_ids:
+        for row in _task_rows(rng, user_id, tasks_per_user, today):
+            batch.append(row)
+            if len(batch) >= CHUNK_SIZE:
+                db.session.execute(db.insert(Task), batch)
+                batch = []
+    if batch:
+        db.session.execute(db.insert(Task), batch)
+    db.session.commit()
+
+    stats.rebuild(user_ids)
+    if search.backend() == 'builtin':
+        search.rebuild()
+    return [(user_id, user["email"]) for user_id, user in zip(user_ids, users)]
+
+
+def first_task_ids(user_ids):
+    """One existing task id per user, for the single-task read scenarios"""
+    rows = db.session.execute(
+        db.select(Task.user_id, db.func.min(Task.id)).where(Task.user_id.in_(user_ids)).group_by(Task.user_id)
+    )
+    return dict(rows.all())
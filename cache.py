@@ -0,0 +1,229 @@
+"""Caches shared by the request path.
+
+``LRUCache`` is the in-process building block. ``ResponseCache`` stores serialized task
+listings behind a pluggable backend: ``memory`` (an LRUCache per process), ``redis`` (needs
+the optional ``redis`` package and ``RESPONSE_CACHE_URL``), ``local-kv`` (an in-process
+stand-in exposing the same get/set/delete subset as a redis client) or ``none``.
+"""
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+try:
+    import redis
+except ImportError:
+    redis = None
+
+
+class LRUCache:
+    """Thread-safe bounded LRU mapping with optional per-entry expiry (epoch seconds).
+
+    ``on_evict(key)`` is called, outside the lock, for entries dropped by the size bound or
+    found expired.
+    """
+
+    def __init__(self, maxsize=1024, ttl=None, on_evict=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.on_evict = on_evict
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        expired = False
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None:
+                value, expires_at = entry
+                if expires_at is None or time.time() < expires_at:
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._data[key]
+                expired = True
+            self.misses += 1
+        if expired and self.on_evict is not None:
+            self.on_evict(key)
+        return default
+
+    def set(self, key, value, expires_at=None):
+        if expires_at is None and self.ttl is not None:
+            expires_at = time.time() + self.ttl
+        evicted = []
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                evicted.append(self._data.popitem(last=False)[0])
+        if self.on_evict is not None:
+            for old_key in evicted:
+                self.on_evict(old_key)
+
+    def pop(self, key, default=None):
+        with self._lock:
+            entry = self._data.pop(key, None)
+        return default if entry is None else entry[0]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self):
+        return {"size": len(self._data), "maxsize": self.maxsize, "hits": self.hits, "misses": self.misses}
+
+
+class MemoryBackend:
+    def __init__(self, maxsize=10000, ttl=60, on_evict=None):
+        self._cache = LRUCache(maxsize=maxsize, ttl=ttl, on_evict=on_evict)
+
+    def get(self, key):
+        return self._cache.get(key)
+
+    def set(self, key, value, ttl):
+        self._cache.set(key, value, expires_at=time.time() + ttl)
+
+    def delete(self, keys):
+        for key in keys:
+            self._cache.pop(key)
+
+
+class LocalKeyValueStore:
+    """Minimal in-process stand-in for a redis client (get, set with ``ex``, delete)"""
+
+    def __init__(self, maxsize=10000):
+        self._cache = LRUCache(maxsize=maxsize)
+
+    def get(self, name):
+        return self._cache.get(name)
+
+    def set(self, name, value, ex=None):
+        self._cache.set(name, value, expires_at=time.time() + ex if ex else None)
+        return True
+
+    def delete(self, *names):
+        return sum(1 for name in names if self._cache.pop(name) is not None)
+
+
+class KeyValueBackend:
+    def __init__(self, client, prefix='task-cache:'):
+        self._client = client
+        self._prefix = prefix
+
+    def get(self, key):
+        return self._client.get(self._prefix + key)
+
+    def set(self, key, value, ttl):
+        self._client.set(self._prefix + key, value, ex=ttl)
+
+    def delete(self, keys):
+        if keys:
+            self._client.delete(*[self._prefix + key for key in keys])
+
+
+class ResponseCache:
+    """Serialized task listings keyed by user, data version and normalized query parameters.
+
+    The user's ``data_version`` is part of every key, so a write on any process makes the
+    old entries unreachable. ``invalidate`` additionally drops the entries this process
+    stored for the user, and the TTL bounds everything else.
+    """
+
+    def __init__(self, backend=None, ttl=60):
+        self.backend = backend if backend is not None else MemoryBackend(ttl=ttl, on_evict=self._forget)
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        # {user_id: {key: expires_at}} stored by this process, for eager invalidation; keys
+        # leave when the entry is evicted, expires or is found missing
+        self._keys_by_user = LRUCache(maxsize=100000)
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        app.config.setdefault('RESPONSE_CACHE_BACKEND', 'memory')
+        app.config.setdefault('RESPONSE_CACHE_SIZE', 10000)
+        app.config.setdefault('RESPONSE_CACHE_TTL', 60)
+        kind = app.config['RESPONSE_CACHE_BACKEND']
+        size = app.config['RESPONSE_CACHE_SIZE']
+        self.ttl = app.config['RESPONSE_CACHE_TTL']
+        if kind == 'none':
+            self.backend = None
+        elif kind == 'memory':
+            self.backend = MemoryBackend(maxsize=size, ttl=self.ttl, on_evict=self._forget)
+        elif kind == 'local-kv':
+            self.backend = KeyValueBackend(LocalKeyValueStore(maxsize=size))
+        elif kind == 'redis':
+            if redis is None:
+                raise RuntimeError("RESPONSE_CACHE_BACKEND='redis' requires the redis package")
+            self.backend = KeyValueBackend(redis.Redis.from_url(app.config['RESPONSE_CACHE_URL']))
+        else:
+            raise ValueError(f"Unknown RESPONSE_CACHE_BACKEND {kind!r}")
+
+    @staticmethod
+    def _key(user_id, version, params):
+        digest = hashlib.sha1(repr(params).encode('utf-8')).hexdigest()
+        return f"{user_id}:{version}:{digest}"
+
+    def get(self, user_id, version, params):
+        if self.backend is None:
+            return None
+        key = self._key(user_id, version, params)
+        value = self.backend.get(key)
+        with self._lock:
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        if value is None:
+            self._forget(key)
+        return value
+
+    def set(self, user_id, version, params, value):
+        if self.backend is None:
+            return
+        key = self._key(user_id, version, params)
+        self.backend.set(key, value, self.ttl)
+        now = time.time()
+        with self._lock:
+            keys = self._keys_by_user.get(user_id)
+            if keys is None:
+                keys = {}
+                self._keys_by_user.set(user_id, keys)
+            # the TTL has dropped these from any backend, including ones that cannot report it
+            for old_key in [old_key for old_key, expires_at in keys.items() if expires_at <= now]:
+                del keys[old_key]
+            keys[key] = now + self.ttl
+
+    def _forget(self, key):
+        user_id = int(key.split(':', 1)[0])
+        with self._lock:
+            keys = self._keys_by_user.get(user_id)
+            if keys is not None:
+                keys.pop(key, None)
+
+    def invalidate(self, user_id):
+        with self._lock:
+            keys = self._keys_by_user.pop(user_id, ())
+            self.invalidations += 1
+        if self.backend is not None and keys:
+            self.backend.delete(list(keys))
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "invalidations": self.invalidations,
+            "hit_rate": self.hits / lookups if lookups else 0.0
+        }
+
+
+response_cache = ResponseCache()
@@ -0,0 +1,186 @@
+"""Negotiated response compression.
+
+Responses of a compressible type (``COMPRESS_MIMETYPES``) are encoded with the best coding
+the client accepts: ``zstd`` (needs the optional ``zstandard`` package), ``br`` (needs
+``brotli``) or ``gzip``, in that order of preference when the client rates them equally.
+Bodies under ``COMPRESS_MIN_SIZE`` bytes are sent as they are. Streamed bodies, such as
+GET /tasks/export, are compressed as they are produced and flushed every
+``COMPRESS_CHUNK_SIZE`` bytes of input, so the client still receives them progressively.
+``text/event-stream`` is never compressed: every event has to reach the client at once.
+
+A compressed response's ETag is made weak, as nginx does; handlers compare
+``If-None-Match`` weakly, so a cached representation in any coding revalidates. Compressed
+bodies with a strong ETag are kept in a small LRU (``COMPRESS_CACHE_SIZE``), so repeated
+reads of a large unchanged listing are compressed once.
+"""
+import gzip
+import zlib
+from flask import current_app, request
+from cache import LRUCache
+from instrumentation import timed
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+DEFAULT_MIN_SIZE = 1024
+DEFAULT_CHUNK_SIZE = 64 * 1024
+DEFAULT_CACHE_SIZE = 256
+DEFAULT_MIMETYPES = ('application/json', 'application/x-ndjson', 'text/csv', 'text/html', 'text/plain')
+
+
+class _GzipStream:
+    def __init__(self, level):
+        self._compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def compress(self, data):
+        return self._compressor.compress(data)
+
+    def flush(self):
+        return self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self):
+        return self._compressor.flush(zlib.Z_FINISH)
+
+
+class _BrotliStream:
+    def __init__(self, level):
+        self._compressor = brotli.Compressor(quality=level)
+
+    def compress(self, data):
+        return self._compressor.process(data)
+
+    def flush(self):
+        return self._compressor.flush()
+
+    def finish(self):
+        return self._compressor.finish()
+
+
+class _ZstdStream:
+    def __init__(self, level):
+        self._compressor = zstandard.ZstdCompressor(level=level).compressobj()
+
+    def compress(self, data):
+        return self._compressor.compress(data)
+
+    def flush(self):
+        return self._compressor.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+
+    def finish(self):
+        return self._compressor.flush()
+
+
+def available_encodings():
+    """Supported codings, most preferred first"""
+    encodings = []
+    if zstandard is not None:
+        encodings.append('zstd')
+    if brotli is not None:
+        encodings.append('br')
+    encodings.append('gzip')
+    return encodings
+
+
+def compress(data, encoding, level=None):
+    if encoding == 'gzip':
+        return gzip.compress(data, compresslevel=6 if level is None else level, mtime=0)
+    if encoding == 'br':
+        return brotli.compress(data, quality=5 if level is None else level)
+    if encoding == 'zstd':
+        return zstandard.ZstdCompressor(level=3 if level is None else level).compress(data)
+    raise ValueError(f"Unsupported encoding {encoding!r}")
+
+
+def compress_stream(chunks, encoding, chunk_size=DEFAULT_CHUNK_SIZE, level=None):
+    """Compress an iterable of byte strings, flushing every ``chunk_size`` bytes of input"""
+    if encoding == 'gzip':
+        stream = _GzipStream(6 if level is None else level)
+    elif encoding == 'br':
+        stream = _BrotliStream(5 if level is None else level)
+    elif encoding == 'zstd':
+        stream = _ZstdStream(3 if level is None else level)
+    else:
+        raise ValueError(f"Unsupported encoding {encoding!r}")
+    pending = 0
+    for chunk in chunks:
+        if isinstance(chunk, str):
+            chunk = chunk.encode('utf-8')
+        out = stream.compress(chunk)
+        pending += len(chunk)
+        if pending >= chunk_size:
+            out += stream.flush()
+            pending = 0
+        if out:
+            yield out
+    yield stream.finish()
+
+
+class Compression:
+    def __init__(self):
+        self._cache = LRUCache(maxsize=DEFAULT_CACHE_SIZE)
+
+    def init_app(self, app):
+        app.config.setdefault('COMPRESS_MIN_SIZE', DEFAULT_MIN_SIZE)
+        app.config.setdefault('COMPRESS_CHUNK_SIZE', DEFAULT_CHUNK_SIZE)
+        app.config.setdefault('COMPRESS_LEVEL', None)
+        app.config.setdefault('COMPRESS_MIMETYPES', DEFAULT_MIMETYPES)
+        app.config.setdefault('COMPRESS_CACHE_SIZE', DEFAULT_CACHE_SIZE)
+        self._cache = LRUCache(maxsize=app.config['COMPRESS_CACHE_SIZE'])
+        # registered after instrumentation, so it runs first and its time is reported
+        app.after_request(self._after_request)
+
+    def negotiate(self):
+        """Best coding the client accepts, or None"""
+        accepted = request.accept_encodings
+        best, best_quality = None, 0
+        for encoding in available_encodings():
+            # also matches "*"; 0 when the client did not list it or refused it with q=0
+            quality = accepted[encoding]
+            if quality > best_quality:
+                best, best_quality = encoding, quality
+        return best
+
+    def _after_request(self, response):
+        config = current_app.config
+        if (response.mimetype not in config['COMPRESS_MIMETYPES'] or request.method == 'HEAD'
+                or response.status_code < 200 or response.status_code in (204, 206, 304)
+                or 'Content-Encoding' in response.headers):
+            return response
+        response.vary.add('Accept-Encoding')
+        encoding = self.negotiate()
+        if encoding is None:
+            return response
+        level = config['COMPRESS_LEVEL']
+
+        if response.is_streamed:
+            response.response = compress_stream(response.response, encoding, config['COMPRESS_CHUNK_SIZE'], level)
+            response.headers.pop('Content-Length', None)
+            response.direct_passthrough = False
+        else:
+            body = response.get_data()
+            if len(body) < config['COMPRESS_MIN_SIZE']:
+                return response
+            etag, weak = response.get_etag()
+            key = (etag, encoding) if etag and not weak else None
+            compressed = self._cache.get(key) if key else None
+            if compressed is None:
+                with timed('compress'):
+                    compressed = compress(body, encoding, level)
+                if key:
+                    self._cache.set(key, compressed)
+            response.set_data(compressed)
+        response.headers['Content-Encoding'] = encoding
+        etag, weak = response.get_etag()
+        if etag and not weak:
+            response.set_etag(etag, weak=True)
+        return response
+
+
+compression = Compression()
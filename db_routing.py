@@ -0,0 +1,88 @@
+"""Primary/replica routing for ``db.session``.
+
+Handlers decorated with ``@read_only`` send their SELECTs to one of the binds listed in
+``SQLALCHEMY_REPLICA_BINDS``; everything else, and every flush or INSERT/UPDATE/DELETE, goes
+to the primary. Once a session has written, it stays on the primary, and so does the same
+user for ``SQLALCHEMY_REPLICA_STICKY_SECONDS`` after a write (read-your-writes). Stickiness
+is tracked per process, so keep the window above the expected replica lag.
+
+With sharding enabled (see shards.py) each session instead goes to its user's shard, and
+replicas are not used.
+"""
+import random
+import time
+from functools import wraps
+from flask import current_app, g, has_request_context, request
+from flask_sqlalchemy.session import Session
+from cache import LRUCache
+
+STICKY_USERS_SIZE = 100000
+
+# user id -> time until which that user's reads stay on the primary
+_sticky_users = LRUCache(maxsize=STICKY_USERS_SIZE)
+
+
+def read_only(fn):
+    """Allow the handler's queries to be served by a replica"""
+    @wraps(fn)
+    def wrapper(*args, **kwargs):
+        g.db_read_only = True
+        return fn(*args, **kwargs)
+    return wrapper
+
+
+def _request_user_id():
+    return getattr(request, "user_id", None) if has_request_context() else None
+
+
+def stick_to_primary(user_id):
+    """Keep ``user_id``'s reads on the primary for the sticky window, e.g. after a write made on its behalf"""
+    sticky = current_app.config.get("SQLALCHEMY_REPLICA_STICKY_SECONDS", 5)
+    _sticky_users.set(user_id, True, expires_at=time.time() + sticky)
+
+
+class RoutingSession(Session):
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None:
+            shard = self._shard_engine()
+            if shard is not None:
+                return shard
+            if self._flushing or getattr(clause, "is_dml", False):
+                self._mark_write()
+            else:
+                replica = self._replica_engine()
+                if replica is not None:
+                    return replica
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+    def _mark_write(self):
+        self.info["wrote"] = True
+        user_id = _request_user_id()
+        if user_id is not None:
+            stick_to_primary(user_id)
+
+    def _shard_engine(self):
+        """The session's shard when sharding is on (see shards.py), picked on first use"""
+        router = current_app.extensions.get("shard_router")
+        if router is None or not router.shards:
+            return None
+        key = self.info.get("shard")
+        if key is None:
+            user_id = _request_user_id()
+            if user_id is None:
+                raise RuntimeError("No shard selected for this session; use shard_router.each_shard()")
+            key = self.info["shard"] = router.shard_for_user(user_id)
+        return self._db.engines[key]
+
+    def _replica_engine(self):
+        if self.info.get("wrote") or not has_request_context() or not g.get("db_read_only"):
+            return None
+        keys = current_app.config.get("SQLALCHEMY_REPLICA_BINDS")
+        if not keys:
+            return None
+        user_id = _request_user_id()
+        if user_id is not None and _sticky_users.get(user_id):
+            return None
+        # pin one replica per session so a request sees a single snapshot
+        key = self.info.setdefault("replica", random.choice(keys))
+        return self._db.engines[key]
@@ -0,0 +1,220 @@
+"""Server-sent events for task changes (``GET /tasks/events``).
+
+Events are derived from the change tracking in sync.py, not kept in memory. The event id is
+the user's ``data_version``, so a client resuming with ``Last-Event-ID`` is replayed every
+create, update and delete after it from ``tasks`` and ``task_tombstones``.
+
+Subscribers only need a wake-up when one of their user's writes commits. The broker fans
+that out over ``EVENTS_CHANNEL``:
+
+* ``memory`` - in-process, published from the session's after_commit hook. Only reaches
+  subscribers in the same process as the writer, so each heartbeat also re-reads the
+  user's version: writes from other worker processes arrive within a heartbeat.
+* ``postgres`` - ``pg_notify`` inside the writing transaction (delivered on commit) and one
+  ``LISTEN`` connection per process that wakes the local subscribers.
+
+"auto" (the default) picks ``postgres`` on PostgreSQL. An idle subscriber is a wake-up flag
+and a heartbeat every ``EVENTS_HEARTBEAT_SECONDS``; it holds no database connection. Serve
+through asgi.py so it does not hold a thread either.
+"""
+import logging
+import os
+import select
+import threading
+from collections import defaultdict
+from flask import current_app
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import make_url
+from sqlalchemy.pool import NullPool
+from aio import Signal
+from db_routing import RoutingSession
+from models import Task, TaskTombstone, User, db
+from serializers import dumps, rows_to_dicts, task_columns
+
+logger = logging.getLogger('task_api.events')
+
+NOTIFY_CHANNEL = 'task_events'
+DEFAULT_HEARTBEAT_SECONDS = 15
+DEFAULT_MAX_REPLAY = 1000
+
+
+class Subscription:
+    def __init__(self, user_id):
+        self.user_id = user_id
+        self.signal = Signal()
+
+
+class EventBroker:
+    def __init__(self):
+        self._subscribers = defaultdict(set)
+        self._lock = threading.Lock()
+        self._listener_pid = None
+
+    def init_app(self, app):
+        app.config.setdefault('EVENTS_CHANNEL', 'auto')
+        app.config.setdefault('EVENTS_HEARTBEAT_SECONDS', DEFAULT_HEARTBEAT_SECONDS)
+        app.config.setdefault('EVENTS_MAX_REPLAY', DEFAULT_MAX_REPLAY)
+
+    def channel(self):
+        configured = current_app.config.get('EVENTS_CHANNEL', 'auto')
+        if configured != 'auto':
+            return configured
+        return 'postgres' if db.engine.dialect.name == 'postgresql' else 'memory'
+
+    def subscribe(self, user_id):
+        if self.channel() == 'postgres':
+            self._ensure_listener()
+        subscription = Subscription(user_id)
+        with self._lock:
+            self._subscribers[user_id].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscribers = self._subscribers.get(subscription.user_id)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._subscribers[subscription.user_id]
+
+    def publish(self, user_ids):
+        """Wake this process's subscribers of ``user_ids``"""
+        with self._lock:
+            subscriptions = [sub for user_id in user_ids for sub in self._subscribers.get(user_id, ())]
+        for subscription in subscriptions:
+            subscription.signal.set()
+
+    def announce(self, user_ids):
+        """Called inside a task write's transaction; subscribers are woken once it commits"""
+        if self.channel() == 'postgres':
+            # every process, this one included, hears it through its listener
+            for user_id in user_ids:
+                db.session.execute(db.select(db.func.pg_notify(NOTIFY_CHANNEL, str(user_id))))
+        else:
+            db.session.info.setdefault('changed_users', set()).update(user_ids)
+
+    def stats(self):
+        with self._lock:
+            return {"users": len(self._subscribers), "subscribers": sum(len(subs) for subs in self._subscribers.values())}
+
+    def _ensure_listener(self):
+        with self._lock:
+            if self._listener_pid == os.getpid():
+                return
+            self._listener_pid = os.getpid()
+        # notifications are sent on the writer's shard, so listen on each of them
+        urls = [db.engines[key].url for key in current_app.config.get('SQLALCHEMY_SHARDS') or [None]]
+        for url in urls:
+            # LISTEN needs a plain blocking psycopg2 connection, also when the app runs on asyncpg
+            engine = create_engine(make_url(url).set(drivername='postgresql+psycopg2'), poolclass=NullPool)
+            threading.Thread(target=self._listen, args=(engine,), name='task-events-listener', daemon=True).start()
+
+    def _listen(self, engine):
+        while True:
+            try:
+                connection = engine.raw_connection()
+                try:
+                    connection.driver_connection.autocommit = True
+                    cursor = connection.cursor()
+                    cursor.execute(f"LISTEN {NOTIFY_CHANNEL}")
+                    driver_connection = connection.driver_connection
+                    while True:
+                        if select.select([driver_connection], [], [], 60) == ([], [], []):
+                            continue
+                        driver_connection.poll()
+                        user_ids = {int(notify.payload) for notify in driver_connection.notifies}
+                        driver_connection.notifies.clear()
+                        self.publish(user_ids)
+                finally:
+                    connection.close()
+            except Exception:
+                logger.exception("task event listener failed; reconnecting")
+                threading.Event().wait(5)
+
+
+broker = EventBroker()
+
+
+@event.listens_for(RoutingSession, 'after_commit')
+def _publish_committed(session):
+    user_ids = session.info.pop('changed_users', None)
+    if user_ids:
+        broker.publish(user_ids)
+
+
+@event.listens_for(RoutingSession, 'after_rollback')
+def _discard_rolled_back(session):
+    session.info.pop('changed_users', None)
+
+
+def changes_since(user_id, since, limit):
+    """Events after version ``since`` as ``(events, version)``, oldest first.
+
+    ``events`` is None when there are more than ``limit``; the client should then resync with
+    GET /tasks/changes. ``version`` is the user's current version (None for an unknown user).
+    """
+    current = db.session.scalar(db.select(User.data_version).where(User.id == user_id))
+    if current is None or current <= since:
+        return [], current
+    rows = db.session.execute(
+        db.select(*task_columns(extra=('version', 'created_version')))
+        .where(Task.user_id == user_id, Task.version > since, Task.version <= current)
+        .order_by(Task.version, Task.id).limit(limit + 1)
+    ).all()
+    tombstones = db.session.execute(
+        db.select(TaskTombstone.task_id, TaskTombstone.version)
+        .where(TaskTombstone.user_id == user_id, TaskTombstone.version > since, TaskTombstone.version <= current)
+        .order_by(TaskTombstone.version, TaskTombstone.task_id).limit(limit + 1)
+    ).all()
+    if len(rows) + len(tombstones) > limit:
+        return None, current
+
+    events = []
+    for row, task in zip(rows, rows_to_dicts(rows)):
+        events.append((row.version, 'created' if row.created_version > since else 'updated', task))
+    for task_id, version in tombstones:
+        events.append((version, 'deleted', {"id": task_id}))
+    events.sort(key=lambda item: item[0])
+    return events, current
+
+
+def format_event(kind, data, event_id=None):
+    event_line = b'' if event_id is None else f"id: {event_id}\n".encode('ascii')
+    return f"event: {kind}\n".encode('ascii') + event_line + b"data: " + dumps(data) + b"\n\n"
+
+
+def stream(user_id, since):
+    """SSE body for ``user_id`` starting after version ``since``.
+
+    Updates are coalesced per task; only the last event of each version carries an ``id``, so a
+    client that reconnects mid-batch replays the whole batch. A ``reset`` event means more
+    changes were missed than ``EVENTS_MAX_REPLAY``; fetch them with GET /tasks/changes.
+    """
+    heartbeat = current_app.config.get('EVENTS_HEARTBEAT_SECONDS', DEFAULT_HEARTBEAT_SECONDS)
+    limit = current_app.config.get('EVENTS_MAX_REPLAY', DEFAULT_MAX_REPLAY)
+    # subscribed before the first read, so a commit in between is never missed
+    subscription = broker.subscribe(user_id)
+    # the memory channel never hears other processes' writes; poll for them on each heartbeat
+    poll = broker.channel() != 'postgres'
+    try:
+        yield b"retry: 3000\n\n"
+        pending = True
+        while True:
+            if pending:
+                events, current = changes_since(user_id, since, limit)
+                # idle subscribers hold no connection
+                db.session.close()
+                if events is None:
+                    yield format_event('reset', {"version": current}, current)
+                else:
+                    for i, (version, kind, data) in enumerate(events):
+                        last_of_version = i + 1 == len(events) or events[i + 1][0] != version
+                        yield format_event(kind, data, version if last_of_version else None)
+                if current is not None:
+                    since = max(since, current)
+            pending = subscription.signal.wait(heartbeat)
+            if not pending:
+                yield b": keep-alive\n\n"
+                pending = poll
+    finally:
+        broker.unsubscribe(subscription)
@@ -0,0 +1,105 @@
+"""Group commit: coalesce concurrent writes into one transaction.
+
+``GroupCommit(apply).submit(item)`` queues ``item`` and blocks until it is written. The
+first caller of an empty batch becomes its leader: it waits up to ``GROUP_COMMIT_MAX_WAIT_MS``
+for others to join (less once ``GROUP_COMMIT_MAX_BATCH`` items are queued), then calls
+``apply(items)`` on its own ``db.session`` and commits once for everyone. If that fails, each
+item is retried in a transaction of its own, so every caller gets its own result or
+exception. Waiting works for threads and for requests served through asgi.py.
+
+Batches are per ``key``; pass the shard so a batch never spans databases. Items of different
+users share a transaction, so ``apply`` has to take their locks in a consistent order.
+"""
+import threading
+from flask import current_app
+from aio import Signal
+from models import db
+
+DEFAULT_MAX_BATCH = 64
+DEFAULT_MAX_WAIT_MS = 2
+
+
+class _Entry:
+    def __init__(self, item):
+        self.item = item
+        self.signal = Signal()
+        self.done = False
+        self.result = None
+        self.error = None
+
+
+class _Batch:
+    def __init__(self):
+        self.entries = []
+        self.full = Signal()
+
+
+class GroupCommit:
+    def __init__(self, apply):
+        self.apply = apply
+        self.batches = 0
+        self.items = 0
+        self._open = {}
+        self._lock = threading.Lock()
+
+    def submit(self, item, key=None):
+        """Write ``item`` as part of a batch; returns its result from ``apply`` or raises its error"""
+        max_batch = current_app.config.get('GROUP_COMMIT_MAX_BATCH', DEFAULT_MAX_BATCH)
+        entry = _Entry(item)
+        with self._lock:
+            batch = self._open.get(key)
+            leader = batch is None
+            if leader:
+                batch = self._open[key] = _Batch()
+            batch.entries.append(entry)
+            if len(batch.entries) >= max_batch:
+                del self._open[key]
+                batch.full.set()
+
+        if leader:
+            batch.full.wait(current_app.config.get('GROUP_COMMIT_MAX_WAIT_MS', DEFAULT_MAX_WAIT_MS) / 1000)
+            with self._lock:
+                if self._open.get(key) is batch:
+                    del self._open[key]
+            self._run(batch.entries)
+        else:
+            while not entry.done:
+                entry.signal.wait(1)
+        if entry.error is not None:
+            raise entry.error
+        return entry.result
+
+    def _run(self, entries):
+        try:
+            try:
+                results = self.apply([entry.item for entry in entries])
+                db.session.commit()
+            except Exception as e:
+                db.session.rollback()
+                if len(entries) == 1:
+                    entries[0].error = e
+                else:
+                    for entry in entries:
+                        self._run_alone(entry)
+            else:
+                for entry, result in zip(entries, results):
+                    entry.result = result
+            with self._lock:
+                self.batches += 1
+                self.items += len(entries)
+        finally:
+            for entry in entries:
+                entry.done = True
+                entry.signal.set()
+
+    def _run_alone(self, entry):
+        try:
+            entry.result = self.apply([entry.item])[0]
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            entry.error = e
+
+    def stats(self):
+        with self._lock:
+            return {"batches": self.batches, "items": self.items}
@@ -0,0 +1,104 @@
+"""Password hashing off the request workers.
+
+werkzeug's password hashes are deliberately slow, so /register and /login hand them to a
+small dedicated process pool instead of running them inline. The pool is bounded twice:
+``PASSWORD_HASH_WORKERS`` processes hash concurrently and at most ``PASSWORD_HASH_QUEUE``
+further requests may wait for one. Anything beyond that is rejected with HashingBusy so the
+route can answer 503 straight away instead of tying up a worker.
+Set ``PASSWORD_HASH_WORKERS = 0`` to hash inline (useful for tests and one-off scripts; it
+blocks the event loop in async mode). The hashing processes are started with forkserver
+(spawn where that is unavailable), so a script that hashes must guard its entry point with
+``if __name__ == '__main__'``.
+"""
+import asyncio
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, TimeoutError
+from werkzeug.security import generate_password_hash, check_password_hash
+from aio import wait_future
+
+
+class HashingBusy(Exception):
+    """Raised when the hashing pool is saturated or a hash did not finish in time"""
+
+
+def _start_context():
+    methods = multiprocessing.get_all_start_methods()
+    return multiprocessing.get_context('forkserver' if 'forkserver' in methods else 'spawn')
+
+
+class PasswordHasher:
+    def __init__(self, max_workers=2, max_queue=32, timeout=10):
+        self._executor = None
+        self._pid = None
+        self._in_flight = 0
+        self._lock = threading.Lock()
+        self.configure(max_workers, max_queue, timeout)
+
+    def init_app(self, app):
+        app.config.setdefault('PASSWORD_HASH_WORKERS', self.max_workers)
+        app.config.setdefault('PASSWORD_HASH_QUEUE', self.max_queue)
+        app.config.setdefault('PASSWORD_HASH_TIMEOUT', self.timeout)
+        self.configure(
+            app.config['PASSWORD_HASH_WORKERS'],
+            app.config['PASSWORD_HASH_QUEUE'],
+            app.config['PASSWORD_HASH_TIMEOUT']
+        )
+
+    def configure(self, max_workers, max_queue, timeout):
+        self.shutdown()
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.timeout = timeout
+
+    def _get_executor(self):
+        # created lazily so each pre-forked server worker gets its own pool. By then the worker
+        # is running request threads, so the hashing processes come from a forkserver (or are
+        # spawned) rather than forked: a fork could copy a lock another thread was holding
+        with self._lock:
+            if self._executor is None or self._pid != os.getpid():
+                self._executor = ProcessPoolExecutor(max_workers=self.max_workers, mp_context=_start_context())
+                self._pid = os.getpid()
+            return self._executor
+
+    def _run(self, fn, *args):
+        if not self.max_workers:
+            return fn(*args)
+        with self._lock:
+            if self._in_flight >= self.max_workers + self.max_queue:
+                raise HashingBusy("password hashing queue is full")
+            self._in_flight += 1
+        try:
+            future = self._get_executor().submit(fn, *args)
+        except BaseException:
+            self._release()
+            raise
+        future.add_done_callback(self._release)
+        try:
+            return wait_future(future, self.timeout)
+        except (TimeoutError, asyncio.TimeoutError):
+            raise HashingBusy("password hashing timed out")
+
+    def _release(self, future=None):
+        with self._lock:
+            self._in_flight -= 1
+
+    def generate(self, password):
+        return self._run(generate_password_hash, password)
+
+    def check(self, pwhash, password):
+        return self._run(check_password_hash, pwhash, password)
+
+    def stats(self):
+        return {"workers": self.max_workers, "queue": self.max_queue, "in_flight": self._in_flight}
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None and self._pid == os.getpid():
+                self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+            self._pid = None
+
+
+password_hasher = PasswordHasher()
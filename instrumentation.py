@@ -0,0 +1,216 @@
+"""Per-request instrumentation.
+
+For every request this records SQL statement counts and time (via SQLAlchemy engine events),
+time spent in JWT decoding, Pydantic validation, JSON serialization and compression, and the
+total. The breakdown is returned in a ``Server-Timing`` header and aggregated into
+per-endpoint histograms served in Prometheus text format from ``/metrics``. When
+``SLOW_REQUEST_THRESHOLD_MS`` is set, slower requests are logged together with their SQL.
+
+Metrics are kept per process; scrape every worker.
+"""
+import logging
+import threading
+import time
+from collections import defaultdict
+from flask import Response, current_app, g, has_app_context, request
+from pydantic import BaseModel
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger('task_api.slow_requests')
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+PHASES = ('jwt', 'validate', 'db', 'serialize', 'compress')
+
+
+def record_timing(phase, seconds):
+    """Add ``seconds`` to ``phase`` for the current request (no-op outside a request)"""
+    if has_app_context():
+        timings = g.get('_timings')
+        if timings is not None:
+            timings[phase] += seconds
+
+
+class timed:
+    """Context manager that records its duration under ``phase``"""
+
+    def __init__(self, phase):
+        self.phase = phase
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        record_timing(self.phase, time.perf_counter() - self.started)
+
+
+class TimedModel(BaseModel):
+    """Request schema base class that records validation time"""
+
+    def __init__(self, **data):
+        with timed('validate'):
+            super().__init__(**data)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(names, values, extra=None):
+    pairs = list(zip(names, values)) + ([extra] if extra else [])
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}' if pairs else ''
+
+
+class Histogram:
+    def __init__(self, name, help_text, label_names, buckets):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self.buckets = buckets
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, labels, value):
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[0][i] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for labels, (counts, total, count) in sorted(self._series.items()):
+                for bound, bucket_count in zip(self.buckets, counts):
+                    lines.append(f"{self.name}_bucket{_labels(self.label_names, labels, ('le', bound))} {bucket_count}")
+                lines.append(f"{self.name}_bucket{_labels(self.label_names, labels, ('le', '+Inf'))} {count}")
+                lines.append(f"{self.name}_sum{_labels(self.label_names, labels)} {total}")
+                lines.append(f"{self.name}_count{_labels(self.label_names, labels)} {count}")
+        return lines
+
+
+class Counter:
+    def __init__(self, name, help_text, label_names):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self._values = defaultdict(float)
+        self._lock = threading.Lock()
+
+    def inc(self, labels, amount=1):
+        with self._lock:
+            self._values[labels] += amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for labels, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_labels(self.label_names, labels)} {value}")
+        return lines
+
+
+class Instrumentation:
+    def __init__(self):
+        self.request_duration = Histogram(
+            'http_request_duration_seconds', 'Request latency by endpoint.', ('endpoint', 'method'), LATENCY_BUCKETS
+        )
+        self.phase_duration = Counter(
+            'http_request_phase_seconds_total', 'Time spent per request phase by endpoint.', ('endpoint', 'phase')
+        )
+        self.sql_queries = Histogram(
+            'db_queries_per_request', 'SQL statements executed per request.', ('endpoint',), QUERY_COUNT_BUCKETS
+        )
+        self.requests = Counter('http_requests_total', 'Requests by endpoint and status.', ('endpoint', 'method', 'status'))
+        self._gauges = {}
+        self._listening = False
+
+    def init_app(self, app):
+        app.config.setdefault('SLOW_REQUEST_THRESHOLD_MS', None)
+        app.config.setdefault('METRICS_PATH', '/metrics')
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+        app.add_url_rule(app.config['METRICS_PATH'], 'metrics', self.metrics_view)
+        if not self._listening:
+            event.listen(Engine, 'before_cursor_execute', self._before_cursor_execute)
+            event.listen(Engine, 'after_cursor_execute', self._after_cursor_execute)
+            self._listening = True
+
+    def add_gauge(self, name, help_text, fn, metric_type='gauge'):
+        """Expose ``fn()`` as a single-sample metric on /metrics"""
+        self._gauges[name] = (help_text, fn, metric_type)
+
+    def _before_request(self):
+        g._request_started = time.perf_counter()
+        g._timings = defaultdict(float)
+        g._sql_count = 0
+        g._sql_log = [] if current_app.config['SLOW_REQUEST_THRESHOLD_MS'] is not None else None
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        # kept on the execution context, so a failed statement leaves nothing behind on the connection
+        if context is not None:
+            context._query_started = time.perf_counter()
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        started = getattr(context, '_query_started', None)
+        if started is None:
+            return
+        elapsed = time.perf_counter() - started
+        if not has_app_context() or g.get('_timings') is None:
+            return
+        g._timings['db'] += elapsed
+        g._sql_count += 1
+        if g._sql_log is not None:
+            g._sql_log.append((elapsed, statement))
+
+    def _after_request(self, response):
+        started = g.pop('_request_started', None)
+        timings = g.pop('_timings', None)
+        if started is None or timings is None:
+            return response
+        total = time.perf_counter() - started
+        endpoint = request.endpoint or 'unmatched'
+        sql_count = g.pop('_sql_count', 0)
+        sql_log = g.pop('_sql_log', None)
+
+        entries = [f'total;dur={total * 1000:.2f}']
+        for phase in PHASES:
+            if phase in timings:
+                desc = f';desc="{sql_count} queries"' if phase == 'db' else ''
+                entries.append(f'{phase};dur={timings[phase] * 1000:.2f}{desc}')
+                self.phase_duration.inc((endpoint, phase), timings[phase])
+        response.headers.add('Server-Timing', ', '.join(entries))
+
+        self.request_duration.observe((endpoint, request.method), total)
+        self.sql_queries.observe((endpoint,), sql_count)
+        self.requests.inc((endpoint, request.method, response.status_code))
+
+        threshold = current_app.config['SLOW_REQUEST_THRESHOLD_MS']
+        if threshold is not None and total * 1000 >= threshold:
+            logger.warning(
+                "slow request %s %s -> %s in %.1fms (%d queries, %.1fms SQL)%s",
+                request.method, request.full_path.rstrip('?'), response.status_code, total * 1000,
+                sql_count, timings['db'] * 1000,
+                ''.join(f"\n  [{elapsed * 1000:.1f}ms] {statement}" for elapsed, statement in sql_log or ())
+            )
+        return response
+
+    def render(self):
+        lines = []
+        for metric in (self.requests, self.request_duration, self.phase_duration, self.sql_queries):
+            lines.extend(metric.render())
+        for name, (help_text, fn, metric_type) in self._gauges.items():
+            lines.extend([f"# HELP {name} {help_text}", f"# TYPE {name} {metric_type}", f"{name} {fn()}"])
+        return '\n'.join(lines) + '\n'
+
+    def metrics_view(self):
+        g.pop('_timings', None)
+        return Response(self.render(), mimetype='text/plain; version=0.0.4')
+
+
+instrumentation = Instrumentation()
@@ -0,0 +1,17 @@
+-- Stored priority rank for index-backed sorting of GET /tasks, plus composite
+-- indexes matching the listing filters and orderings.
+-- Works on PostgreSQL and SQLite. Run once against an existing database:
+--   psql flaskdb -f migrations/0001_task_priority_rank.sql
+
+ALTER TABLE tasks ADD COLUMN priority_rank SMALLINT NOT NULL DEFAULT 4;
+
+UPDATE tasks SET priority_rank = CASE priority
+    WHEN 'High' THEN 1
+    WHEN 'Medium' THEN 2
+    WHEN 'Low' THEN 3
+    ELSE 4
+END;
+
+CREATE INDEX ix_tasks_user_due_rank ON tasks (user_id, due_date, priority_rank, id);
+CREATE INDEX ix_tasks_user_rank ON tasks (user_id, priority_rank, id);
+CREATE INDEX ix_tasks_user_status_due ON tasks (user_id, status, due_date);
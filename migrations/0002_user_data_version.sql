@@ -0,0 +1,4 @@
+-- Per-user data version behind the ETags on GET /tasks and GET /tasks/<id>.
+-- Every task write increments it in the same transaction.
+
+ALTER TABLE users ADD COLUMN data_version INTEGER NOT NULL DEFAULT 0;
@@ -0,0 +1,22 @@
+-- Per-user task counters behind GET /tasks/stats, backfilled from the tasks table.
+-- Re-running the backfill is equivalent to `flask rebuild-task-stats`.
+
+CREATE TABLE task_stats (
+    user_id INTEGER NOT NULL PRIMARY KEY REFERENCES users (id),
+    total INTEGER NOT NULL DEFAULT 0,
+    completed INTEGER NOT NULL DEFAULT 0,
+    high INTEGER NOT NULL DEFAULT 0,
+    medium INTEGER NOT NULL DEFAULT 0,
+    low INTEGER NOT NULL DEFAULT 0
+);
+
+INSERT INTO task_stats (user_id, total, completed, high, medium, low)
+SELECT users.id,
+       COUNT(tasks.id),
+       COALESCE(SUM(CASE WHEN tasks.status THEN 1 ELSE 0 END), 0),
+       COALESCE(SUM(CASE WHEN tasks.priority = 'High' THEN 1 ELSE 0 END), 0),
+       COALESCE(SUM(CASE WHEN tasks.priority = 'Medium' THEN 1 ELSE 0 END), 0),
+       COALESCE(SUM(CASE WHEN tasks.priority = 'Low' THEN 1 ELSE 0 END), 0)
+FROM users
+LEFT OUTER JOIN tasks ON tasks.user_id = users.id
+GROUP BY users.id;
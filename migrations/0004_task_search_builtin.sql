@@ -0,0 +1,12 @@
+-- Full-text search, built-in inverted index (SQLite and other non-PostgreSQL databases).
+-- After running this, populate the index with: flask rebuild-search-index
+
+CREATE TABLE task_terms (
+    user_id INTEGER NOT NULL,
+    term VARCHAR(64) NOT NULL,
+    task_id INTEGER NOT NULL,
+    weight INTEGER NOT NULL,
+    PRIMARY KEY (user_id, term, task_id)
+);
+
+CREATE INDEX ix_task_terms_task ON task_terms (task_id);
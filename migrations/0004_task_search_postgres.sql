@@ -0,0 +1,9 @@
+-- Full-text search, PostgreSQL backend (SEARCH_BACKEND=auto/postgres).
+-- The tsvector is generated by the database, so no backfill is needed.
+
+ALTER TABLE tasks ADD COLUMN search_vector tsvector GENERATED ALWAYS AS (
+    setweight(to_tsvector('english', coalesce(title, '')), 'A') ||
+    setweight(to_tsvector('english', coalesce(description, '')), 'B')
+) STORED;
+
+CREATE INDEX ix_tasks_search_vector ON tasks USING GIN (search_vector);
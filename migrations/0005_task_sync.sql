@@ -0,0 +1,14 @@
+-- Change tracking behind GET /tasks/changes.
+-- tasks.version holds the owner's data_version after the last write to the row; existing rows
+-- start at 0 and are only returned by a full sync. Deletes leave a tombstone at their version.
+
+ALTER TABLE tasks ADD COLUMN version INTEGER NOT NULL DEFAULT 0;
+CREATE INDEX ix_tasks_user_version ON tasks (user_id, version);
+
+CREATE TABLE task_tombstones (
+    user_id INTEGER NOT NULL,
+    version INTEGER NOT NULL,
+    task_id INTEGER NOT NULL,
+    deleted_at TIMESTAMP NOT NULL,
+    PRIMARY KEY (user_id, version, task_id)
+);
@@ -0,0 +1,20 @@
+-- Cold storage for completed tasks, filled by `flask archive-tasks`.
+-- Same columns as tasks (ids are kept), read only by GET /tasks?include_archived=true.
+
+CREATE INDEX ix_tasks_status_due ON tasks (status, due_date);
+
+CREATE TABLE tasks_archive (
+    id INTEGER NOT NULL PRIMARY KEY,
+    title VARCHAR(100) NOT NULL,
+    description TEXT,
+    due_date DATE NOT NULL,
+    priority VARCHAR(10) NOT NULL,
+    priority_rank SMALLINT NOT NULL,
+    status BOOLEAN,
+    user_id INTEGER NOT NULL REFERENCES users (id),
+    version INTEGER NOT NULL DEFAULT 0,
+    archived_at TIMESTAMP NOT NULL
+);
+
+CREATE INDEX ix_tasks_archive_user_due_rank ON tasks_archive (user_id, due_date, priority_rank, id);
+CREATE INDEX ix_tasks_archive_user_rank ON tasks_archive (user_id, priority_rank, id);
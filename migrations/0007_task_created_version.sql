@@ -0,0 +1,4 @@
+-- Version at which each task was created, so GET /tasks/events can tell creates from updates.
+
+ALTER TABLE tasks ADD COLUMN created_version INTEGER NOT NULL DEFAULT 0;
+ALTER TABLE tasks_archive ADD COLUMN created_version INTEGER NOT NULL DEFAULT 0;
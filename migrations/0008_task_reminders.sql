@@ -0,0 +1,4 @@
+-- Due date each task's reminder was sent for, set by `flask send-reminders`.
+-- Pending reminders are found through ix_tasks_status_due.
+
+ALTER TABLE tasks ADD COLUMN reminded_for DATE;
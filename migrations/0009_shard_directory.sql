@@ -0,0 +1,17 @@
+-- Shard directory, applied to the DATABASE_URL database when DATABASE_SHARD_URLS is set.
+-- Every shard gets the regular schema (0001-0008). Fill both tables with
+-- `flask shards init-directory` before serving traffic.
+
+CREATE TABLE user_shards (
+    user_id INTEGER NOT NULL PRIMARY KEY,
+    email VARCHAR(120) NOT NULL UNIQUE,
+    shard VARCHAR(64) NOT NULL,
+    moving BOOLEAN NOT NULL DEFAULT FALSE
+);
+
+CREATE INDEX ix_user_shards_shard ON user_shards (shard);
+
+CREATE TABLE id_blocks (
+    name VARCHAR(32) NOT NULL PRIMARY KEY,
+    next_id BIGINT NOT NULL
+);
@@ -0,0 +1,42 @@
+-- SQLite only: rebuild tasks with AUTOINCREMENT so ids are never reused.
+-- Without it a new task can take the id of the highest archived (or deleted) task, and
+-- archiving that task later collides with its namesake in tasks_archive.
+-- Databases created by db.create_all() after 0006 already have it. PostgreSQL sequences
+-- never reuse ids and need nothing.
+
+CREATE TABLE tasks_rebuilt (
+    id INTEGER NOT NULL PRIMARY KEY AUTOINCREMENT,
+    title VARCHAR(100) NOT NULL,
+    description TEXT,
+    due_date DATE NOT NULL,
+    priority VARCHAR(10) NOT NULL,
+    priority_rank SMALLINT NOT NULL DEFAULT 4,
+    status BOOLEAN,
+    user_id INTEGER NOT NULL REFERENCES users (id),
+    version INTEGER NOT NULL DEFAULT 0,
+    created_version INTEGER NOT NULL DEFAULT 0,
+    reminded_for DATE
+);
+
+INSERT INTO tasks_rebuilt (id, title, description, due_date, priority, priority_rank, status, user_id, version, created_version, reminded_for)
+SELECT id, title, description, due_date, priority, priority_rank, status, user_id, version, created_version, reminded_for
+FROM tasks;
+
+DROP TABLE tasks;
+ALTER TABLE tasks_rebuilt RENAME TO tasks;
+
+CREATE INDEX ix_tasks_user_due_rank ON tasks (user_id, due_date, priority_rank, id);
+CREATE INDEX ix_tasks_user_rank ON tasks (user_id, priority_rank, id);
+CREATE INDEX ix_tasks_user_status_due ON tasks (user_id, status, due_date);
+CREATE INDEX ix_tasks_user_version ON tasks (user_id, version);
+CREATE INDEX ix_tasks_status_due ON tasks (status, due_date);
+
+-- continue past every id already handed out, including archived and deleted tasks
+INSERT INTO sqlite_sequence (name, seq)
+SELECT 'tasks', 0 WHERE NOT EXISTS (SELECT 1 FROM sqlite_sequence WHERE name = 'tasks');
+
+UPDATE sqlite_sequence SET seq = MAX(
+    seq,
+    COALESCE((SELECT MAX(id) FROM tasks_archive), 0),
+    COALESCE((SELECT MAX(task_id) FROM task_tombstones), 0)
+) WHERE name = 'tasks';
@@ -1,9 +1,36 @@
-from flask_sqlalchemy import SQLAlchemy
-from pydantic import BaseModel, EmailStr, constr
+import sqlalchemy as sa
+from flask_sqlalchemy import SQLAlchemy as BaseSQLAlchemy
+from sqlalchemy import event
+from db_routing import RoutingSession
+from pydantic import EmailStr, constr
+from instrumentation import TimedModel
 from enum import Enum
+import datetime
 from typing import Optional
 
-db = SQLAlchemy()
+# only accepted by QueuePool (and its asyncio variant)
+QUEUE_POOL_OPTIONS = ('pool_size', 'max_overflow', 'pool_timeout')
+
+
+class SQLAlchemy(BaseSQLAlchemy):
+    def _apply_driver_defaults(self, options, app):
+        super()._apply_driver_defaults(options, app)
+        # in-memory SQLite gets a StaticPool/SingletonThreadPool, which rejects the pool sizing options
+        url = sa.engine.make_url(options['url'])
+        poolclass = options.get('poolclass') or url.get_dialect().get_pool_class(url)
+        if not issubclass(poolclass, sa.pool.QueuePool):
+            for key in QUEUE_POOL_OPTIONS:
+                options.pop(key, None)
+
+
+db = SQLAlchemy(session_options={"class_": RoutingSession})
+
+PRIORITY_RANKS = {'High': 1, 'Medium': 2, 'Low': 3}
+UNKNOWN_PRIORITY_RANK = len(PRIORITY_RANKS) + 1
+
+def priority_rank(priority):
+    """Sortable integer for a priority name (High sorts first)"""
+    return PRIORITY_RANKS.get(priority, UNKNOWN_PRIORITY_RANK)
 
 class User(db.Model):
     __tablename__ = 'users' 
@@ -11,23 +38,111 @@ class User(db.Model):
     username = db.Column(db.String(100), nullable=False)
     email = db.Column(db.String(120), unique=True, nullable=False)
     password = db.Column(db.String(256), nullable=False)
+    # bumped on every task write; backs the ETags on task reads
+    data_version = db.Column(db.Integer, nullable=False, default=0)
 
 class Task(db.Model):
     __tablename__ = 'tasks'
+    __table_args__ = (
+        db.Index('ix_tasks_user_due_rank', 'user_id', 'due_date', 'priority_rank', 'id'),
+        db.Index('ix_tasks_user_rank', 'user_id', 'priority_rank', 'id'),
+        db.Index('ix_tasks_user_status_due', 'user_id', 'status', 'due_date'),
+        db.Index('ix_tasks_user_version', 'user_id', 'version'),
+        db.Index('ix_tasks_status_due', 'status', 'due_date'),
+        # never reuse ids: archived tasks keep theirs
+        {'sqlite_autoincrement': True},
+    )
     id = db.Column(db.Integer, primary_key=True)
     title = db.Column(db.String(100), nullable=False)
     description = db.Column(db.Text, nullable=True)
     due_date = db.Column(db.Date, nullable=False)
     priority = db.Column(db.String(10), nullable=False)
+    priority_rank = db.Column(db.SmallInteger, nullable=False, default=UNKNOWN_PRIORITY_RANK)
     status = db.Column(db.Boolean, default=False)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    # the owner's data_version after the write that last created or changed this row
+    version = db.Column(db.Integer, nullable=False, default=0)
+    # ... and after the write that created it
+    created_version = db.Column(db.Integer, nullable=False, default=0)
+    # due date a reminder was last sent for (see reminders.py)
+    reminded_for = db.Column(db.Date, nullable=True)
+
+class ArchivedTask(db.Model):
+    """Completed tasks moved out of ``tasks`` by the archiver (see archive.py); same columns plus archived_at"""
+    __tablename__ = 'tasks_archive'
+    __table_args__ = (
+        db.Index('ix_tasks_archive_user_due_rank', 'user_id', 'due_date', 'priority_rank', 'id'),
+        db.Index('ix_tasks_archive_user_rank', 'user_id', 'priority_rank', 'id'),
+    )
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    title = db.Column(db.String(100), nullable=False)
+    description = db.Column(db.Text, nullable=True)
+    due_date = db.Column(db.Date, nullable=False)
+    priority = db.Column(db.String(10), nullable=False)
+    priority_rank = db.Column(db.SmallInteger, nullable=False)
+    status = db.Column(db.Boolean, default=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    version = db.Column(db.Integer, nullable=False, default=0)
+    created_version = db.Column(db.Integer, nullable=False, default=0)
+    archived_at = db.Column(db.DateTime, nullable=False, default=datetime.datetime.utcnow)
+
+class TaskTombstone(db.Model):
+    """Marker left by a task delete so delta sync can report it (see sync.py)"""
+    __tablename__ = 'task_tombstones'
+    user_id = db.Column(db.Integer, primary_key=True)
+    version = db.Column(db.Integer, primary_key=True)
+    task_id = db.Column(db.Integer, primary_key=True)
+    deleted_at = db.Column(db.DateTime, nullable=False, default=datetime.datetime.utcnow)
+
+class TaskStats(db.Model):
+    """Per-user counters kept in step with ``tasks`` by the task write handlers (see stats.py)"""
+    __tablename__ = 'task_stats'
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), primary_key=True)
+    total = db.Column(db.Integer, nullable=False, default=0)
+    completed = db.Column(db.Integer, nullable=False, default=0)
+    high = db.Column(db.Integer, nullable=False, default=0)
+    medium = db.Column(db.Integer, nullable=False, default=0)
+    low = db.Column(db.Integer, nullable=False, default=0)
+
+class TaskTerm(db.Model):
+    """Posting list entry of the built-in full-text index over task titles and descriptions (see search.py)"""
+    __tablename__ = 'task_terms'
+    __table_args__ = (
+        db.Index('ix_task_terms_task', 'task_id'),
+    )
+    user_id = db.Column(db.Integer, primary_key=True)
+    term = db.Column(db.String(64), primary_key=True)
+    task_id = db.Column(db.Integer, primary_key=True)
+    weight = db.Column(db.Integer, nullable=False)
+
+class UserShard(db.Model):
+    """Directory entry placing a user on a shard (see shards.py); kept on the default bind"""
+    __tablename__ = 'user_shards'
+    __table_args__ = (
+        db.Index('ix_user_shards_shard', 'shard'),
+    )
+    user_id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    email = db.Column(db.String(120), unique=True, nullable=False)
+    shard = db.Column(db.String(64), nullable=False)
+    # set while `flask shards move` copies the user; requests get a 503 meanwhile
+    moving = db.Column(db.Boolean, nullable=False, default=False)
+
+class IdBlock(db.Model):
+    """Next unallocated user or task id across all shards; handed out in blocks"""
+    __tablename__ = 'id_blocks'
+    name = db.Column(db.String(32), primary_key=True)
+    next_id = db.Column(db.BigInteger, nullable=False)
+
+@event.listens_for(Task.priority, 'set')
+def _sync_priority_rank(target, value, oldvalue, initiator):
+    target.priority_rank = priority_rank(value)
 
-class UserRegister(BaseModel):
+class UserRegister(TimedModel):
     username: str
     email: EmailStr
     password: constr(min_length=6)
 
-class UserLogin(BaseModel):
+class UserLogin(TimedModel):
     email: EmailStr
     password: str
 
@@ -36,14 +151,14 @@ class PriorityEnum(str, Enum):
     Medium = "Medium"
     Low = "Low"
 
-class TaskSchema(BaseModel):
+class TaskSchema(TimedModel):
     title: constr(max_length=100)
     description: str = None
     due_date: str
     priority: PriorityEnum
     status: bool
 
-class TaskUpdateSchema(BaseModel):
+class TaskUpdateSchema(TimedModel):
     title: Optional[constr(max_length=100)] = None
     description: Optional[str] = None
     due_date: Optional[str] = None
@@ -0,0 +1,243 @@
+"""Due-date reminders (``flask send-reminders``).
+
+A task's reminder is due ``REMINDER_LEAD_HOURS`` before the start (UTC) of its due date.
+The scheduler keeps the reminders due within the next ``REMINDER_RESCAN_SECONDS`` in a
+min-heap, loaded by paging through the (status, due_date) index over that short window of
+due dates only, and rescans the window on that interval to pick up new and edited tasks.
+A tick pops what is due and hands it to the sink in batches of ``REMINDER_BATCH_SIZE``, so
+its cost follows the reminders sent, not the size of ``tasks``.
+
+``tasks.reminded_for`` records the due date a reminder went out for. A batch is claimed and
+committed before the sink is called, so no row stays locked while the sink works; if the
+sink fails the claim is cleared again and the next rescan retries the batch. Moving a
+task's due date re-arms its reminder. Reminders are not sent for tasks already overdue, or completed.
+Run a single scheduler at a time.
+
+Sinks (``REMINDER_SINK``): ``file`` appends JSON lines to ``REMINDER_FILE``; ``webhook``
+POSTs ``{"reminders": [...]}`` to ``REMINDER_WEBHOOK_URL``.
+"""
+import datetime
+import heapq
+import logging
+import threading
+import time
+import urllib.request
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from models import Task, User, db
+from serializers import dumps
+from shards import shard_router
+
+logger = logging.getLogger('task_api.reminders')
+
+DEFAULT_LEAD_HOURS = 24
+DEFAULT_BATCH_SIZE = 100
+DEFAULT_PAGE_SIZE = 1000
+DEFAULT_RESCAN_SECONDS = 300
+
+
+class FileSink:
+    """Appends one JSON line per reminder"""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def send(self, reminders):
+        with self._lock, open(self.path, 'ab') as f:
+            f.write(b''.join(dumps(reminder) + b'\n' for reminder in reminders))
+
+
+class WebhookSink:
+    """POSTs each batch as JSON; any non-2xx response fails the batch"""
+
+    def __init__(self, url, timeout=10):
+        self.url = url
+        self.timeout = timeout
+
+    def send(self, reminders):
+        req = urllib.request.Request(
+            self.url, data=dumps({"reminders": reminders}), headers={'Content-Type': 'application/json'}, method='POST'
+        )
+        with urllib.request.urlopen(req, timeout=self.timeout):
+            pass
+
+
+def make_sink(config):
+    kind = config.get('REMINDER_SINK', 'file')
+    if kind == 'file':
+        return FileSink(config.get('REMINDER_FILE', 'reminders.jsonl'))
+    if kind == 'webhook':
+        if not config.get('REMINDER_WEBHOOK_URL'):
+            raise RuntimeError("REMINDER_SINK='webhook' requires REMINDER_WEBHOOK_URL")
+        return WebhookSink(config['REMINDER_WEBHOOK_URL'])
+    raise ValueError(f"Unknown REMINDER_SINK {kind!r}")
+
+
+class ReminderScheduler:
+    def __init__(self, sink, lead_hours=DEFAULT_LEAD_HOURS, batch_size=DEFAULT_BATCH_SIZE,
+                 page_size=DEFAULT_PAGE_SIZE, rescan_seconds=DEFAULT_RESCAN_SECONDS):
+        self.sink = sink
+        self.lead = datetime.timedelta(hours=lead_hours)
+        self.batch_size = batch_size
+        self.page_size = page_size
+        self.rescan = datetime.timedelta(seconds=rescan_seconds)
+        # (remind_at, task_id, due_date, shard); entries whose due date no longer matches are skipped
+        self._heap = []
+        self._scheduled = {}
+        self._next_rescan = None
+
+    @classmethod
+    def from_config(cls, config):
+        return cls(
+            make_sink(config),
+            lead_hours=config.get('REMINDER_LEAD_HOURS', DEFAULT_LEAD_HOURS),
+            batch_size=config.get('REMINDER_BATCH_SIZE', DEFAULT_BATCH_SIZE),
+            page_size=config.get('REMINDER_PAGE_SIZE', DEFAULT_PAGE_SIZE),
+            rescan_seconds=config.get('REMINDER_RESCAN_SECONDS', DEFAULT_RESCAN_SECONDS),
+        )
+
+    def remind_at(self, due_date):
+        return datetime.datetime.combine(due_date, datetime.time.min) - self.lead
+
+    def _pending(self, now, until):
+        """Open, unreminded tasks whose reminder falls between now's date and ``until``"""
+        # remind_at(d) <= t  <=>  d <= (t + lead).date()
+        return db.and_(
+            Task.status == db.false(),
+            Task.due_date >= now.date(),
+            Task.due_date <= (until + self.lead).date(),
+            db.or_(Task.reminded_for.is_(None), Task.reminded_for != Task.due_date),
+        )
+
+    def load(self, now):
+        """Page the upcoming window of every shard into the heap; returns how many reminders were added"""
+        added = sum(self._load_shard(now, shard) for shard in shard_router.each_shard())
+        self._next_rescan = now + self.rescan
+        return added
+
+    def _load_shard(self, now, shard):
+        added = 0
+        after = None
+        while True:
+            query = db.select(Task.id, Task.due_date).where(self._pending(now, now + self.rescan))
+            if after is not None:
+                query = query.where(db.or_(
+                    Task.due_date > after[0], db.and_(Task.due_date == after[0], Task.id > after[1])
+                ))
+            rows = db.session.execute(query.order_by(Task.due_date, Task.id).limit(self.page_size)).all()
+            for task_id, due_date in rows:
+                if self._scheduled.get(task_id) != due_date:
+                    self._scheduled[task_id] = due_date
+                    heapq.heappush(self._heap, (self.remind_at(due_date), task_id, due_date, shard))
+                    added += 1
+            if len(rows) < self.page_size:
+                break
+            after = rows[-1]
+        return added
+
+    def pop_due(self, now):
+        """Due task ids grouped by shard"""
+        due = {}
+        while self._heap and self._heap[0][0] <= now:
+            _, task_id, due_date, shard = heapq.heappop(self._heap)
+            if self._scheduled.get(task_id) == due_date:
+                del self._scheduled[task_id]
+                due.setdefault(shard, []).append(task_id)
+        return due
+
+    def dispatch(self, due, now):
+        """Claim and send the reminders in ``due`` ({shard: task_ids}); returns how many were sent"""
+        sent = 0
+        for shard in shard_router.each_shard():
+            if due.get(shard):
+                sent += self._dispatch_shard(due[shard], now)
+        return sent
+
+    def _dispatch_shard(self, task_ids, now):
+        sent = 0
+        for start in range(0, len(task_ids), self.batch_size):
+            batch = task_ids[start:start + self.batch_size]
+            try:
+                claimed, emails = self._claim(batch, now)
+            except Exception:
+                db.session.rollback()
+                logger.exception("claiming %d reminder(s) failed", len(batch))
+                continue
+            if not claimed:
+                continue
+            # sent after the claim commits, so a slow sink never holds the claimed rows' locks
+            try:
+                self.sink.send([
+                    {"task_id": row.id, "user_id": row.user_id, "email": emails.get(row.user_id),
+                     "title": row.title, "due_date": row.due_date}
+                    for row in claimed
+                ])
+            except Exception:
+                logger.exception("sending %d reminder(s) failed", len(claimed))
+                self._release(claimed)
+                continue
+            sent += len(claimed)
+        return sent
+
+    def _claim(self, batch, now):
+        """Mark the batch's still-pending tasks as reminded and commit; returns (rows, {user_id: email})"""
+        # re-checked here: the task may have been completed, moved or deleted since loading
+        claimed = db.session.execute(
+            db.update(Task).where(Task.id.in_(batch), self._pending(now, now))
+            .values(reminded_for=Task.due_date)
+            .returning(Task.id, Task.user_id, Task.title, Task.due_date),
+            execution_options={"synchronize_session": False}
+        ).all()
+        emails = {}
+        if claimed:
+            emails = dict(db.session.execute(
+                db.select(User.id, User.email).where(User.id.in_({row.user_id for row in claimed}))
+            ).all())
+        db.session.commit()
+        return claimed, emails
+
+    def _release(self, claimed):
+        """Undo the claim of reminders the sink did not take, so the next rescan schedules them again"""
+        try:
+            # a task whose due date moved meanwhile is re-armed already and left alone
+            db.session.execute(
+                db.update(Task).where(Task.id.in_([row.id for row in claimed]), Task.reminded_for == Task.due_date)
+                .values(reminded_for=None),
+                execution_options={"synchronize_session": False}
+            )
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            logger.exception("releasing %d reminder(s) failed; they will not be sent", len(claimed))
+
+    def tick(self, now=None):
+        """Rescan if due, then send what is due; returns how many reminders were sent"""
+        now = now or datetime.datetime.utcnow()
+        if self._next_rescan is None or now >= self._next_rescan:
+            self.load(now)
+        return self.dispatch(self.pop_due(now), now)
+
+    def seconds_until_next(self, now=None):
+        now = now or datetime.datetime.utcnow()
+        wake = self._next_rescan
+        if self._heap and (wake is None or self._heap[0][0] < wake):
+            wake = self._heap[0][0]
+        return 0 if wake is None else max((wake - now).total_seconds(), 0)
+
+
+@click.command('send-reminders')
+@click.option('--once', is_flag=True, help='Send what is due now and exit instead of running as a worker.')
+@with_appcontext
+def send_reminders_command(once):
+    """Send due-date reminders to the configured sink."""
+    scheduler = ReminderScheduler.from_config(current_app.config)
+    while True:
+        sent = scheduler.tick()
+        if sent or once:
+            click.echo(f"Sent {sent} reminder(s).")
+        if once:
+            return
+        # wake for the next reminder or rescan, whichever comes first
+        time.sleep(min(max(scheduler.seconds_until_next(), 1), scheduler.rescan.total_seconds()))
@@ -1,8 +1,9 @@
 from flask import Blueprint, request, jsonify
-from werkzeug.security import generate_password_hash, check_password_hash
 from pydantic import ValidationError
-from models import User, UserRegister, UserLogin, db
+from models import User, TaskStats, UserRegister, UserLogin, db
 from utils import create_access_token
+from hashing import password_hasher, HashingBusy
+from shards import shard_router, EmailTaken
 
 auth_bp = Blueprint('auth', __name__)
 
@@ -13,13 +14,29 @@ def register():
     except ValidationError as e:
         return jsonify(error=e.errors()), 400
 
+    shard_router.use_for_email(data.email)
     if User.query.filter_by(email=data.email).first():
         return jsonify(message="Email already registered"), 409
 
-    hashed_pw = generate_password_hash(data.password)
-    new_user = User(username=data.username, email=data.email, password=hashed_pw)
+    try:
+        hashed_pw = password_hasher.generate(data.password)
+    except HashingBusy:
+        return jsonify(message="Server busy, please retry"), 503, {"Retry-After": "1"}
+    try:
+        user_id = shard_router.register(data.email)
+    except EmailTaken:
+        return jsonify(message="Email already registered"), 409
+    new_user = User(id=user_id, username=data.username, email=data.email, password=hashed_pw)
     db.session.add(new_user)
-    db.session.commit()
+    try:
+        db.session.flush()
+        db.session.add(TaskStats(user_id=new_user.id))
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        if user_id is not None:
+            shard_router.unregister(user_id)
+        raise
     return jsonify(message="User registered successfully"), 201
 
 @auth_bp.route('/login', methods=['POST'])
@@ -29,9 +46,14 @@ def login():
     except ValidationError as e:
         return jsonify(error=e.errors()), 400
 
+    shard_router.use_for_email(data.email)
     user = User.query.filter_by(email=data.email).first()
-    if user and check_password_hash(user.password, data.password):
-        access_token = create_access_token(identity=user.email)
+    try:
+        valid = user is not None and password_hasher.check(user.password, data.password)
+    except HashingBusy:
+        return jsonify(message="Server busy, please retry"), 503, {"Retry-After": "1"}
+    if valid:
+        access_token = create_access_token(identity=user.email, user_id=user.id)
         return jsonify(access_token=access_token), 200
 
     return jsonify(message="Invalid credentials"), 401
\ No newline at end of file
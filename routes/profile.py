@@ -1,6 +1,7 @@
 from flask import Blueprint, request, jsonify
 from models import User, db
-from utils import jwt_required, get_jwt_identity
+from utils import jwt_required, get_jwt_user_id
+from db_routing import read_only
 
 profile_bp = Blueprint('profile', __name__)
 
@@ -11,9 +12,11 @@ def feature():
 
 @profile_bp.route('/profile', methods=['GET'])
 @jwt_required
+@read_only
 def get_profile():
     """Get user profile information"""
-    user = User.query.filter_by(email=get_jwt_identity()).first()
+    user_id = get_jwt_user_id()
+    user = db.session.get(User, user_id) if user_id is not None else None
     if not user:
         return jsonify(message="User not found"), 404
     
@@ -1,12 +1,294 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, Response, current_app, request, jsonify, stream_with_context
 from pydantic import ValidationError
-from models import User, Task, TaskSchema, TaskUpdateSchema, PriorityEnum, db
-from utils import jwt_required, get_jwt_identity
+from models import User, Task, ArchivedTask, TaskTombstone, TaskSchema, TaskUpdateSchema, PriorityEnum, db, priority_rank
+from serializers import parse_fields, task_columns, rows_to_columns, rows_to_dicts, dumps, json_response
+from utils import jwt_required, get_jwt_user_id
+from db_routing import read_only, stick_to_primary
+from stats import add_delta, apply_delta, get_stats, task_delta
+from search import index_tasks, unindex_tasks, search_query
+from cache import response_cache
+from archive import with_archive
+from events import stream as event_stream
+from shards import shard_router
+from group_commit import GroupCommit
+import sync
+import base64
+import csv
 import datetime
-from collections import OrderedDict
+import hashlib
+import io
+import json
 
 tasks_bp = Blueprint('tasks', __name__)
 
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+MAX_BULK_SIZE = 10000
+BULK_CHUNK_SIZE = 500
+EXPORT_BATCH_SIZE = 1000
+# needed to build the next cursor even when a sparse fieldset leaves them out
+CURSOR_COLUMNS = ('due_date', 'priority_rank', 'id')
+
+
+def _parse_limit(value, default):
+    """Parse the ``limit`` query parameter, raising ValueError when out of range"""
+    if value is None:
+        return default
+    limit = int(value)
+    if not 1 <= limit <= MAX_PAGE_SIZE:
+        raise ValueError(value)
+    return limit
+
+
+def _encode_cursor(sort_by, order, task):
+    """Build an opaque cursor pointing just past ``task`` in the given ordering"""
+    if sort_by == 'priority':
+        values = [task.priority_rank, task.id]
+    else:
+        values = [task.due_date.isoformat(), task.priority_rank, task.id]
+    raw = json.dumps([sort_by, order, values], separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def _decode_cursor(cursor, sort_by, order):
+    """Return the sort key values stored in ``cursor``; raise ValueError if it does not match the query"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        cursor_sort_by, cursor_order, values = json.loads(raw)
+        if cursor_sort_by != sort_by or cursor_order != order:
+            raise ValueError("cursor does not match sort_by/order")
+        types = (int, int) if sort_by == 'priority' else (str, int, int)
+        if not isinstance(values, list) or len(values) != len(types) or not all(
+            type(value) is expected for value, expected in zip(values, types)
+        ):
+            raise ValueError("malformed cursor")
+        if sort_by == 'priority':
+            return values
+        due_date, rank, task_id = values
+        return [datetime.datetime.strptime(due_date, '%Y-%m-%d').date(), rank, task_id]
+    except (TypeError, UnicodeDecodeError) as e:
+        raise ValueError("malformed cursor") from e
+
+
+def _keyset_filter(sort_keys, values):
+    """Rows strictly after ``values`` for a multi-column ordering with mixed directions"""
+    clauses = []
+    for i, (column, direction) in enumerate(sort_keys):
+        after = column < values[i] if direction == 'desc' else column > values[i]
+        clauses.append(db.and_(*[sort_keys[j][0] == values[j] for j in range(i)], after))
+    return db.or_(*clauses)
+
+
+def _listing_query(query, source=Task):
+    """Apply the GET /tasks filter and sort parameters to ``query`` (a Query or Select over ``source``,
+    which is ``Task`` or the ``.c`` of a subquery with the same columns).
+
+    Returns ``(query, sort_by, order, sort_keys)``; raises ValueError with a client-facing
+    message when a parameter is invalid.
+    """
+    due_before = request.args.get('due_before')
+    due_after = request.args.get('due_after')
+    priority = request.args.get('priority')
+    status = request.args.get('status')
+    sort_by = request.args.get('sort_by', 'due_date')
+    order = request.args.get('order', 'asc')
+
+    try:
+        if due_before:
+            query = query.filter(source.due_date <= datetime.datetime.strptime(due_before, '%Y-%m-%d').date())
+        if due_after:
+            query = query.filter(source.due_date >= datetime.datetime.strptime(due_after, '%Y-%m-%d').date())
+    except ValueError:
+        raise ValueError("Invalid date format. Use YYYY-MM-DD.")
+
+    if priority in PriorityEnum.__members__:
+        query = query.filter(source.priority == priority)
+
+    if status is not None:
+        if status.lower() in ['true', 'false']:
+            query = query.filter(source.status == (status.lower() == 'true'))
+        else:
+            raise ValueError("Status must be 'true' or 'false'")
+
+    if sort_by not in ['due_date', 'priority']:
+        raise ValueError("Invalid sort_by value")
+
+    if order not in ['asc', 'desc']:
+        raise ValueError("Invalid order value")
+
+    if sort_by == 'priority':
+        sort_keys = [(source.priority_rank, order), (source.id, order)]
+    else:
+        sort_keys = [(source.due_date, order), (source.priority_rank, 'asc'), (source.id, order)]
+    query = query.order_by(*[column.desc() if direction == 'desc' else column.asc() for column, direction in sort_keys])
+    return query, sort_by, order, sort_keys
+
+
+def _tasks_changed(user_id):
+    """Bump the caller's data version before a task write and return it.
+
+    Runs inside the write's transaction and locks the user row, so it also orders concurrent
+    writes; the new version is stamped on changed rows and tombstones for delta sync.
+    Invalidates the caller's task ETags and cached listings.
+    """
+    return sync.bump_versions([user_id]).get(user_id)
+
+
+def _data_version(user_id):
+    return db.session.scalar(db.select(User.data_version).where(User.id == user_id))
+
+
+def _task_etag(user_id, version, *parts):
+    """Strong ETag for a task read, derived from the user's data version (None if unknown)"""
+    if version is None:
+        return None
+    digest = hashlib.sha1(repr(parts).encode('utf-8')).hexdigest()[:16]
+    return f"{user_id}-{version}-{digest}"
+
+
+def _cache_params(fields, limit, cursor, list_format):
+    """Normalized GET /tasks parameters (already validated by _listing_query) for the response cache key"""
+    args = request.args
+    status = args.get('status')
+    priority = args.get('priority')
+    return (
+        args.get('due_before') or None,
+        args.get('due_after') or None,
+        priority if priority in PriorityEnum.__members__ else None,
+        status.lower() if status is not None else None,
+        args.get('sort_by', 'due_date'),
+        args.get('order', 'asc'),
+        args.get('include_archived', 'false').lower(),
+        fields,
+        limit,
+        cursor,
+        list_format
+    )
+
+
+def _not_modified(etag):
+    response = Response(status=304)
+    response.set_etag(etag)
+    response.vary.add('Authorization')
+    return response
+
+
+def _with_etag(response, etag):
+    if etag is not None:
+        response.set_etag(etag)
+        response.vary.add('Authorization')
+    return response
+
+
+def _bulk_payload():
+    """Return the JSON array body of a bulk request, or None if it is not a bounded list"""
+    items = request.get_json(silent=True)
+    if not isinstance(items, list) or not 1 <= len(items) <= MAX_BULK_SIZE:
+        return None
+    return items
+
+
+def _chunks(values, size=BULK_CHUNK_SIZE):
+    for start in range(0, len(values), size):
+        yield values[start:start + size]
+
+
+def _is_task_id(value):
+    return isinstance(value, int) and not isinstance(value, bool)
+
+
+def _update_values(data):
+    """Column values for the fields set in a TaskUpdateSchema; raises ValueError on a bad date"""
+    values = {}
+    if data.title is not None:
+        values['title'] = data.title
+    if data.description is not None:
+        values['description'] = data.description
+    if data.due_date is not None:
+        values['due_date'] = datetime.datetime.strptime(data.due_date, '%Y-%m-%d').date()
+    if data.priority is not None:
+        values['priority'] = data.priority.value
+        values['priority_rank'] = priority_rank(data.priority.value)
+    if data.status is not None:
+        values['status'] = data.status
+    return values
+
+
+def _archived_ids(user_id, task_ids):
+    """Those of ``task_ids`` that are the caller's archived tasks"""
+    archived = set()
+    for chunk in _chunks(sorted(task_ids)):
+        archived.update(db.session.scalars(
+            db.select(ArchivedTask.id).where(ArchivedTask.user_id == user_id, ArchivedTask.id.in_(chunk))
+        ))
+    return archived
+
+
+def _task_not_found(user_id, task_id):
+    """404, or 409 when the task is archived: archived tasks can be read and deleted, not changed"""
+    if _archived_ids(user_id, [task_id]):
+        return jsonify(message="Task is archived; it can be read or deleted but not changed"), 409
+    return jsonify(message="Task not found"), 404
+
+
+def _reserve_sqlite_ids(count):
+    """Next ``count`` task ids on SQLite. Only safe once the transaction has written (as
+    _tasks_changed does): SQLite then holds its single write lock until commit."""
+    # AUTOINCREMENT never reuses an id, so start past the sequence as well as past the live rows
+    last = db.session.scalar(db.text(
+        "SELECT max(coalesce((SELECT seq FROM sqlite_sequence WHERE name = 'tasks'), 0),"
+        " coalesce((SELECT max(id) FROM tasks), 0), coalesce((SELECT max(id) FROM tasks_archive), 0))"
+    ))
+    return list(range(last + 1, last + 1 + count))
+
+
+def _insert_task_rows(rows):
+    """INSERT task ``rows`` in chunks; returns their ids in order.
+
+    Ordered RETURNING is batched on PostgreSQL, but SQLite can only do it one row per
+    statement, so there the ids are assigned up front (as the shard allocator does anyway).
+    """
+    task_ids = shard_router.allocate_ids('tasks', len(rows))
+    if task_ids is None and db.session.connection().dialect.name == 'sqlite':
+        task_ids = _reserve_sqlite_ids(len(rows))
+    if task_ids is None:
+        return [
+            task_id for chunk in _chunks(rows)
+            for task_id in db.session.scalars(db.insert(Task).returning(Task.id, sort_by_parameter_order=True), chunk)
+        ]
+    for row, task_id in zip(rows, task_ids):
+        row['id'] = task_id
+    for chunk in _chunks(rows):
+        db.session.execute(db.insert(Task), chunk)
+    return task_ids
+
+
+def _bulk_response(results):
+    failed = sum(1 for result in results if result['status'] >= 400)
+    return json_response({"succeeded": len(results) - failed, "failed": failed, "results": results})
+
+
+def _insert_tasks(rows):
+    """Group-commit batch of POST /tasks: insert ``rows`` of any users; returns their ids"""
+    versions = {}
+    # one user at a time in id order, so overlapping batches lock users in the same order
+    for user_id in sorted({row['user_id'] for row in rows}):
+        versions.update(sync.bump_versions([user_id]))
+    rows = [dict(row, version=versions.get(row['user_id']), created_version=versions.get(row['user_id'])) for row in rows]
+    task_ids = _insert_task_rows(rows)
+    terms = {}
+    deltas = {}
+    for task_id, row in zip(task_ids, rows):
+        terms.setdefault(row['user_id'], []).append((task_id, row['title'], row['description']))
+        add_delta(deltas.setdefault(row['user_id'], {}), task_delta(row['priority'], row['status']))
+    for user_id, delta in deltas.items():
+        index_tasks(user_id, terms[user_id])
+        apply_delta(user_id, delta)
+    return task_ids
+
+
+task_creates = GroupCommit(_insert_tasks)
+
 @tasks_bp.route('/tasks', methods=['POST'])
 @jwt_required
 def create_task():
@@ -17,165 +299,564 @@ def create_task():
         return jsonify(error=e.errors()), 400
     except ValueError:
         return jsonify(message="Invalid date format. Use YYYY-MM-DD."), 400
-    user = User.query.filter_by(email=get_jwt_identity()).first()
-    if not user:
+    user_id = get_jwt_user_id()
+    if user_id is None:
         return jsonify(message="User not found"), 404
 
+    if current_app.config.get('TASK_GROUP_COMMIT'):
+        row = {
+            "title": data.title,
+            "description": data.description,
+            "due_date": due_date,
+            "priority": data.priority.value,
+            "priority_rank": priority_rank(data.priority.value),
+            "status": data.status,
+            "user_id": user_id
+        }
+        task_creates.submit(row, key=shard_router.shard_for_user(user_id) if shard_router.shards else None)
+        # the write may have gone through another request's session
+        stick_to_primary(user_id)
+        return jsonify(message="Task created successfully"), 201
+
+    version = _tasks_changed(user_id)
+    task_ids = shard_router.allocate_ids('tasks', 1)
     task = Task(
+        id=task_ids[0] if task_ids else None,
         title=data.title,
         description=data.description,
         due_date=due_date,
         priority=data.priority.value,
         status=data.status,
-        user_id=user.id
+        user_id=user_id,
+        version=version,
+        created_version=version
     )
     db.session.add(task)
+    db.session.flush()
+    index_tasks(user_id, [(task.id, task.title, task.description)])
+    apply_delta(user_id, task_delta(task.priority, task.status))
     db.session.commit()
     return jsonify(message="Task created successfully"), 201
 
 @tasks_bp.route('/tasks', methods=['GET'])
 @jwt_required
+@read_only
 def get_tasks():
-    user = User.query.filter_by(email=get_jwt_identity()).first()
-    if not user:
+    user_id = get_jwt_user_id()
+    if user_id is None:
         return jsonify(message="User not found"), 404
-    query = Task.query.filter_by(user_id=user.id)
 
-    due_before = request.args.get('due_before')
-    due_after = request.args.get('due_after')
-    priority = request.args.get('priority')
-    status = request.args.get('status')
-    sort_by = request.args.get('sort_by', 'due_date')
-    order = request.args.get('order', 'asc')
+    include_archived = request.args.get('include_archived', 'false').lower()
+    if include_archived not in ['true', 'false']:
+        return jsonify(message="include_archived must be 'true' or 'false'"), 400
+    list_format = request.args.get('format', 'json')
+    if list_format not in ['json', 'columnar']:
+        return jsonify(message="format must be 'json' or 'columnar'"), 400
+    try:
+        fields = parse_fields(request.args.get('fields'))
+        if include_archived == 'true':
+            source = with_archive(user_id).c
+            query = db.select(*task_columns(fields, CURSOR_COLUMNS, source))
+        else:
+            source = Task
+            query = db.select(*task_columns(fields, CURSOR_COLUMNS)).where(Task.user_id == user_id)
+        query, sort_by, order, sort_keys = _listing_query(query, source)
+    except ValueError as e:
+        return jsonify(message=str(e)), 400
 
+    cursor = request.args.get('cursor')
     try:
-        if due_before:
-            query = query.filter(Task.due_date <= datetime.datetime.strptime(due_before, '%Y-%m-%d').date())
-        if due_after:
-            query = query.filter(Task.due_date >= datetime.datetime.strptime(due_after, '%Y-%m-%d').date())
+        limit = _parse_limit(request.args.get('limit'), DEFAULT_PAGE_SIZE if cursor else None)
     except ValueError:
-        return jsonify(message="Invalid date format. Use YYYY-MM-DD."), 400
+        return jsonify(message=f"limit must be an integer between 1 and {MAX_PAGE_SIZE}"), 400
 
-    if priority in PriorityEnum.__members__:
-        query = query.filter_by(priority=priority)
+    if cursor:
+        try:
+            values = _decode_cursor(cursor, sort_by, order)
+        except ValueError:
+            return jsonify(message="Invalid cursor"), 400
+        query = query.filter(_keyset_filter(sort_keys, values))
 
-    if status is not None:
-        if status.lower() in ['true', 'false']:
-            query = query.filter_by(status=status.lower() == 'true')
-        else:
-            return jsonify(message="Status must be 'true' or 'false'"), 400
+    version = _data_version(user_id)
+    etag = _task_etag(user_id, version, 'list', sorted(request.args.items(multi=True)))
+    if etag is not None and request.if_none_match.contains_weak(etag):
+        return _not_modified(etag)
 
-    if sort_by not in ['due_date', 'priority']:
-        return jsonify(message="Invalid sort_by value"), 400
+    cache_params = _cache_params(fields, limit, cursor, list_format)
+    body = response_cache.get(user_id, version, cache_params) if version is not None else None
+    if body is not None:
+        response = current_app.response_class(body, mimetype='application/json')
+        response.headers['X-Cache'] = 'HIT'
+        return _with_etag(response, etag)
 
-    if order not in ['asc', 'desc']:
-        return jsonify(message="Invalid order value"), 400
+    next_cursor = None
+    if limit is None:
+        rows = db.session.execute(query).all()
+    else:
+        rows = db.session.execute(query.limit(limit + 1)).all()
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = _encode_cursor(sort_by, order, rows[-1])
 
-    if sort_by == 'priority':
-        priority_order = db.case(
-            (Task.priority == 'High', 1),
-            (Task.priority == 'Medium', 2),
-            (Task.priority == 'Low', 3),
-            else_=4
-        )
-        if order == 'desc':
-            query = query.order_by(priority_order.desc())
-        else:
-            query = query.order_by(priority_order.asc())
+    if list_format == 'columnar':
+        body = dumps(dict(rows_to_columns(rows, fields), next_cursor=next_cursor))
     else:
-        sort_column = getattr(Task, sort_by)
-        priority_order = db.case(
-            (Task.priority == 'High', 1),
-            (Task.priority == 'Medium', 2),
-            (Task.priority == 'Low', 3),
-            else_=4
+        result = rows_to_dicts(rows, fields)
+        body = dumps(result if limit is None else {"tasks": result, "next_cursor": next_cursor})
+    if version is not None:
+        response_cache.set(user_id, version, cache_params, body)
+    response = current_app.response_class(body, mimetype='application/json')
+    response.headers['X-Cache'] = 'MISS'
+    return _with_etag(response, etag)
+
+@tasks_bp.route('/tasks/stats', methods=['GET'])
+@jwt_required
+@read_only
+def task_stats():
+    user_id = get_jwt_user_id()
+    if user_id is None:
+        return jsonify(message="User not found"), 404
+    return json_response(get_stats(user_id))
+
+@tasks_bp.route('/tasks/changes', methods=['GET'])
+@jwt_required
+@read_only
+def task_changes():
+    user_id = get_jwt_user_id()
+    if user_id is None:
+        return jsonify(message="User not found"), 404
+
+    try:
+        fields = parse_fields(request.args.get('fields'))
+    except ValueError as e:
+        return jsonify(message=str(e)), 400
+    since = None
+    if request.args.get('since'):
+        try:
+            since, issued_at = sync.decode_token(request.args['since'])
+        except ValueError:
+            return jsonify(message="Invalid sync token"), 400
+        if sync.token_expired(issued_at):
+            return jsonify(message="Sync token expired; sync again without since"), 410
+
+    current = _data_version(user_id)
+    if current is None:
+        return jsonify(message="User not found"), 404
+    tasks, deleted = [], []
+    if since is None:
+        query = db.select(*task_columns(fields)).where(Task.user_id == user_id, Task.version <= current)
+        tasks = rows_to_dicts(db.session.execute(query.order_by(Task.id)).all(), fields)
+    elif current > since:
+        # bounded by the version read above, so rows committed meanwhile are picked up next time
+        query = db.select(*task_columns(fields)).where(
+            Task.user_id == user_id, Task.version > since, Task.version <= current
         )
-        if order == 'desc':
-            query = query.order_by(sort_column.desc(), priority_order.asc())
+        tasks = rows_to_dicts(db.session.execute(query.order_by(Task.id)).all(), fields)
+        deleted = db.session.scalars(
+            db.select(TaskTombstone.task_id)
+            .where(TaskTombstone.user_id == user_id, TaskTombstone.version > since, TaskTombstone.version <= current)
+            .order_by(TaskTombstone.version)
+        ).all()
+    return json_response({
+        "tasks": tasks,
+        "deleted": deleted,
+        "next_token": sync.encode_token(max(current, since or 0)),
+        "full": since is None
+    })
+
+@tasks_bp.route('/tasks/events', methods=['GET'])
+@jwt_required
+def task_events():
+    user_id = get_jwt_user_id()
+    if user_id is None:
+        return jsonify(message="User not found"), 404
+
+    last_event_id = request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
+    if last_event_id:
+        try:
+            since = int(last_event_id)
+            if since < 0:
+                raise ValueError(since)
+        except ValueError:
+            return jsonify(message="Invalid Last-Event-ID"), 400
+    else:
+        since = _data_version(user_id)
+        if since is None:
+            return jsonify(message="User not found"), 404
+    db.session.close()
+
+    response = Response(stream_with_context(event_stream(user_id, since)), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+@tasks_bp.route('/tasks/search', methods=['GET'])
+@jwt_required
+@read_only
+def search_tasks():
+    user_id = get_jwt_user_id()
+    if user_id is None:
+        return jsonify(message="User not found"), 404
+
+    try:
+        fields = parse_fields(request.args.get('fields'))
+    except ValueError as e:
+        return jsonify(message=str(e)), 400
+    try:
+        limit = _parse_limit(request.args.get('limit'), DEFAULT_PAGE_SIZE)
+        offset = int(request.args.get('offset', 0))
+        if offset < 0:
+            raise ValueError(offset)
+    except ValueError:
+        return jsonify(message=f"limit must be between 1 and {MAX_PAGE_SIZE} and offset must not be negative"), 400
+
+    query = search_query(user_id, request.args.get('q', ''), task_columns(fields))
+    if query is None:
+        return jsonify(message="q must contain at least one search term"), 400
+
+    rows = db.session.execute(query.limit(limit + 1).offset(offset)).all()
+    next_offset = offset + limit if len(rows) > limit else None
+    tasks = []
+    for row in rows[:limit]:
+        task = dict(zip(fields, row))
+        task['score'] = float(row.score)
+        tasks.append(task)
+    return json_response({"tasks": tasks, "next_offset": next_offset})
+
+@tasks_bp.route('/tasks/export', methods=['GET'])
+@jwt_required
+@read_only
+def export_tasks():
+    user_id = get_jwt_user_id()
+    if user_id is None:
+        return jsonify(message="User not found"), 404
+
+    export_format = request.args.get('format', 'ndjson')
+    if export_format not in ['ndjson', 'csv']:
+        return jsonify(message="format must be 'ndjson' or 'csv'"), 400
+    include_archived = request.args.get('include_archived', 'false').lower()
+    if include_archived not in ['true', 'false']:
+        return jsonify(message="include_archived must be 'true' or 'false'"), 400
+
+    try:
+        fields = parse_fields(request.args.get('fields'))
+        if include_archived == 'true':
+            source = with_archive(user_id).c
+            query = db.select(*task_columns(fields, source=source))
+        else:
+            source = Task
+            query = db.select(*task_columns(fields)).where(Task.user_id == user_id)
+        query, _, _, _ = _listing_query(query, source)
+    except ValueError as e:
+        return jsonify(message=str(e)), 400
+    # yield_per streams through a server-side cursor where the driver supports one
+    query = query.execution_options(yield_per=EXPORT_BATCH_SIZE)
+
+    def generate():
+        result = db.session.execute(query)
+        if export_format == 'csv':
+            buffer = io.StringIO()
+            writer = csv.writer(buffer)
+            writer.writerow(fields)
+            for rows in result.partitions():
+                writer.writerows(rows)
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+            if buffer.tell():
+                yield buffer.getvalue()
         else:
-            query = query.order_by(sort_column.asc(), priority_order.asc())
-
-    tasks = query.all()
-    return jsonify([
-        OrderedDict([
-            ("id", task.id),
-            ("title", task.title),
-            ("description", task.description),
-            ("due_date", task.due_date.isoformat()),
-            ("priority", task.priority),
-            ("status", task.status)
-        ]) for task in tasks
-    ])
+            for rows in result.partitions():
+                yield b''.join(dumps(task) + b'\n' for task in rows_to_dicts(rows, fields))
+
+    mimetype = 'text/csv' if export_format == 'csv' else 'application/x-ndjson'
+    response = Response(stream_with_context(generate()), mimetype=mimetype)
+    response.headers['Content-Disposition'] = f'attachment; filename=tasks.{export_format}'
+    return response
 
 @tasks_bp.route('/tasks/<int:task_id>', methods=['GET'])
 @jwt_required
+@read_only
 def get_task(task_id):
-    user = User.query.filter_by(email=get_jwt_identity()).first()
-    if not user:
+    user_id = get_jwt_user_id()
+    if user_id is None:
         return jsonify(message="User not found"), 404
 
-    task = Task.query.filter_by(id=task_id, user_id=user.id).first()
+    try:
+        fields = parse_fields(request.args.get('fields'))
+    except ValueError as e:
+        return jsonify(message=str(e)), 400
+
+    etag = _task_etag(user_id, _data_version(user_id), 'task', task_id, fields)
+    if etag is not None and request.if_none_match.contains_weak(etag):
+        return _not_modified(etag)
+
+    task = db.session.execute(
+        db.select(*task_columns(fields)).where(Task.id == task_id, Task.user_id == user_id)
+    ).first()
+    if not task:
+        task = db.session.execute(
+            db.select(*task_columns(fields, source=ArchivedTask))
+            .where(ArchivedTask.id == task_id, ArchivedTask.user_id == user_id)
+        ).first()
     if not task:
         return jsonify(message="Task not found"), 404
-    return jsonify(OrderedDict([
-        ("id", task.id),
-        ("title", task.title),
-        ("description", task.description),
-        ("due_date", task.due_date.isoformat()),
-        ("priority", task.priority),
-        ("status", task.status)
-    ]))
+    return _with_etag(json_response(rows_to_dicts([task], fields)[0]), etag)
 
 @tasks_bp.route('/tasks/<int:task_id>', methods=['PUT'])
 @jwt_required
 def update_task(task_id):
-    user = User.query.filter_by(email=get_jwt_identity()).first()
-    if not user:
+    user_id = get_jwt_user_id()
+    if user_id is None:
         return jsonify(message="User not found"), 404
 
-    task = Task.query.filter_by(id=task_id, user_id=user.id).first()
-    if not task:
-        return jsonify(message="Task not found"), 404
-
     try:
         data = TaskUpdateSchema(**request.json)
-        
-        if data.title is not None:
-            task.title = data.title
-        if data.description is not None:
-            task.description = data.description
-        if data.due_date is not None:
-            task.due_date = datetime.datetime.strptime(data.due_date, '%Y-%m-%d').date()
-        if data.priority is not None:
-            task.priority = data.priority.value
-        if data.status is not None:
-            task.status = data.status
-            
-        db.session.commit()
-        return jsonify(OrderedDict([
-            ("id", task.id),
-            ("title", task.title),
-            ("description", task.description),
-            ("due_date", task.due_date.isoformat()),
-            ("priority", task.priority),
-            ("status", task.status)
-        ])), 200
+        values = _update_values(data)
     except ValidationError as e:
         return jsonify(error=e.errors()), 400
     except ValueError:
         return jsonify(message="Invalid date format. Use YYYY-MM-DD."), 400
 
+    owned = db.and_(Task.id == task_id, Task.user_id == user_id)
+    if not values:
+        task = db.session.execute(db.select(*task_columns()).where(owned)).first()
+        if not task:
+            return _task_not_found(user_id, task_id)
+        return json_response(rows_to_dicts([task])[0])
+
+    # the user row lock taken here serializes every write to this user's tasks
+    values['version'] = _tasks_changed(user_id)
+    update = db.update(Task).where(owned).values(**values)
+    columns = task_columns()
+    old = None
+    if 'priority' in values or 'status' in values:
+        # the counters need the previous values
+        if db.engine.dialect.name == 'postgresql':
+            # read from the statement's snapshot, so no extra round trip; SQLite's RETURNING
+            # cannot see the FROM tables
+            before = db.select(Task.id, Task.priority, Task.status).where(owned).subquery('old')
+            update = update.where(Task.id == before.c.id)
+            columns += [before.c.priority.label('old_priority'), before.c.status.label('old_status')]
+        else:
+            old = db.session.execute(db.select(Task.priority, Task.status).where(owned)).first()
+            if not old:
+                db.session.rollback()
+                return _task_not_found(user_id, task_id)
+
+    task = db.session.execute(
+        update.returning(*columns), execution_options={"synchronize_session": False}
+    ).first()
+    if not task:
+        db.session.rollback()
+        return _task_not_found(user_id, task_id)
+    if 'old_priority' in task._fields:
+        old = (task.old_priority, task.old_status)
+    if old is not None:
+        old_priority, old_status = old
+        apply_delta(user_id, add_delta(task_delta(old_priority, old_status, -1), task_delta(task.priority, task.status)))
+    if 'title' in values or 'description' in values:
+        index_tasks(user_id, [(task.id, task.title, task.description)], replace=True)
+    db.session.commit()
+    return json_response(rows_to_dicts([task])[0])
+
 @tasks_bp.route('/tasks/<int:task_id>', methods=['DELETE'])
 @jwt_required
 def delete_task(task_id):
-    user = User.query.filter_by(email=get_jwt_identity()).first()
-    if not user:
+    user_id = get_jwt_user_id()
+    if user_id is None:
         return jsonify(message="User not found"), 404
 
-    task = Task.query.filter_by(id=task_id, user_id=user.id).first()
-    if not task:
+    version = _tasks_changed(user_id)
+    deleted = db.session.execute(
+        db.delete(Task).where(Task.id == task_id, Task.user_id == user_id).returning(Task.priority, Task.status),
+        execution_options={"synchronize_session": False}
+    ).first()
+    if not deleted:
+        # archived tasks still count in the stats, so they are deleted the same way
+        deleted = db.session.execute(
+            db.delete(ArchivedTask).where(ArchivedTask.id == task_id, ArchivedTask.user_id == user_id)
+            .returning(ArchivedTask.priority, ArchivedTask.status),
+            execution_options={"synchronize_session": False}
+        ).first()
+    if not deleted:
+        db.session.rollback()
         return jsonify(message="Task not found"), 404
-    
-    db.session.delete(task)
+    apply_delta(user_id, task_delta(deleted.priority, deleted.status, -1))
+    unindex_tasks(user_id, [task_id])
+    sync.record_deletes(user_id, [task_id], version)
     db.session.commit()
-    return jsonify(message="Task deleted successfully"), 200
\ No newline at end of file
+    return jsonify(message="Task deleted successfully"), 200
+
+@tasks_bp.route('/tasks/bulk', methods=['POST'])
+@jwt_required
+def bulk_create_tasks():
+    user_id = get_jwt_user_id()
+    if user_id is None:
+        return jsonify(message="User not found"), 404
+    items = _bulk_payload()
+    if items is None:
+        return jsonify(message=f"Body must be a JSON array of 1 to {MAX_BULK_SIZE} tasks"), 400
+
+    results = [None] * len(items)
+    rows, row_indexes = [], []
+    for index, item in enumerate(items):
+        if not isinstance(item, dict):
+            results[index] = {"index": index, "status": 400, "message": "Each item must be a task object"}
+            continue
+        try:
+            data = TaskSchema(**item)
+            due_date = datetime.datetime.strptime(data.due_date, '%Y-%m-%d').date()
+        except ValidationError as e:
+            results[index] = {"index": index, "status": 400, "error": e.errors()}
+            continue
+        except ValueError:
+            results[index] = {"index": index, "status": 400, "message": "Invalid date format. Use YYYY-MM-DD."}
+            continue
+        rows.append({
+            "title": data.title,
+            "description": data.description,
+            "due_date": due_date,
+            "priority": data.priority.value,
+            "priority_rank": priority_rank(data.priority.value),
+            "status": data.status,
+            "user_id": user_id
+        })
+        row_indexes.append(index)
+
+    if rows:
+        version = _tasks_changed(user_id)
+        for row in rows:
+            row['version'] = row['created_version'] = version
+        task_ids = _insert_task_rows(rows)
+        for chunk in _chunks(list(zip(task_ids, rows))):
+            index_tasks(user_id, [(task_id, row['title'], row['description']) for task_id, row in chunk])
+        delta = {}
+        for row in rows:
+            add_delta(delta, task_delta(row['priority'], row['status']))
+        apply_delta(user_id, delta)
+        db.session.commit()
+        for index, task_id in zip(row_indexes, task_ids):
+            results[index] = {"index": index, "status": 201, "id": task_id}
+    return _bulk_response(results)
+
+@tasks_bp.route('/tasks/bulk', methods=['PUT'])
+@jwt_required
+def bulk_update_tasks():
+    user_id = get_jwt_user_id()
+    if user_id is None:
+        return jsonify(message="User not found"), 404
+    items = _bulk_payload()
+    if items is None:
+        return jsonify(message=f"Body must be a JSON array of 1 to {MAX_BULK_SIZE} tasks"), 400
+
+    results = [None] * len(items)
+    updates = []
+    for index, item in enumerate(items):
+        task_id = item.get('id') if isinstance(item, dict) else None
+        if not _is_task_id(task_id):
+            results[index] = {"index": index, "status": 400, "message": "Each item needs an integer id"}
+            continue
+        try:
+            data = TaskUpdateSchema(**{key: value for key, value in item.items() if key != 'id'})
+            values = _update_values(data)
+        except ValidationError as e:
+            results[index] = {"index": index, "status": 400, "error": e.errors()}
+            continue
+        except ValueError:
+            results[index] = {"index": index, "status": 400, "message": "Invalid date format. Use YYYY-MM-DD."}
+            continue
+        updates.append((index, task_id, values))
+
+    # taken before the row locks below, in the same order as the single-task handlers
+    version = _tasks_changed(user_id) if updates else None
+    # id -> (priority, status) of the caller's tasks, tracked through the batch for the counters
+    owned = {}
+    for chunk in _chunks(sorted({task_id for _, task_id, _ in updates})):
+        owned.update((task_id, (task_priority, task_status)) for task_id, task_priority, task_status in db.session.execute(
+            db.select(Task.id, Task.priority, Task.status)
+            .where(Task.user_id == user_id, Task.id.in_(chunk))
+            .with_for_update()
+        ))
+
+    archived = _archived_ids(user_id, {task_id for _, task_id, _ in updates} - owned.keys())
+    rows = []
+    delta = {}
+    for index, task_id, values in updates:
+        if task_id in archived:
+            results[index] = {"index": index, "status": 409, "id": task_id,
+                              "message": "Task is archived; it can be read or deleted but not changed"}
+            continue
+        if task_id not in owned:
+            results[index] = {"index": index, "status": 404, "id": task_id, "message": "Task not found"}
+            continue
+        if values:
+            rows.append(dict(values, id=task_id, version=version))
+            old_priority, old_status = owned[task_id]
+            new_priority, new_status = values.get('priority', old_priority), values.get('status', old_status)
+            add_delta(delta, task_delta(old_priority, old_status, -1))
+            add_delta(delta, task_delta(new_priority, new_status))
+            owned[task_id] = (new_priority, new_status)
+        results[index] = {"index": index, "status": 200, "id": task_id}
+
+    if rows:
+        for chunk in _chunks(rows):
+            db.session.execute(db.update(Task), chunk)
+        reindex = sorted({row['id'] for row in rows if 'title' in row or 'description' in row})
+        for chunk in _chunks(reindex):
+            index_tasks(user_id, db.session.execute(
+                db.select(Task.id, Task.title, Task.description).where(Task.id.in_(chunk))
+            ).all(), replace=True)
+        apply_delta(user_id, delta)
+        db.session.commit()
+    else:
+        db.session.rollback()
+    return _bulk_response(results)
+
+@tasks_bp.route('/tasks/bulk', methods=['DELETE'])
+@jwt_required
+def bulk_delete_tasks():
+    user_id = get_jwt_user_id()
+    if user_id is None:
+        return jsonify(message="User not found"), 404
+    items = _bulk_payload()
+    if items is None:
+        return jsonify(message=f"Body must be a JSON array of 1 to {MAX_BULK_SIZE} task ids"), 400
+
+    task_ids = {task_id for task_id in items if _is_task_id(task_id)}
+    version = _tasks_changed(user_id) if task_ids else None
+    deleted = set()
+    delta = {}
+    for chunk in _chunks(sorted(task_ids)):
+        for task_id, task_priority, task_status in db.session.execute(
+            db.delete(Task).where(Task.user_id == user_id, Task.id.in_(chunk))
+            .returning(Task.id, Task.priority, Task.status)
+        ):
+            deleted.add(task_id)
+            add_delta(delta, task_delta(task_priority, task_status, -1))
+    # what is left may be archived; those still count in the stats
+    for chunk in _chunks(sorted(task_ids - deleted)):
+        for task_id, task_priority, task_status in db.session.execute(
+            db.delete(ArchivedTask).where(ArchivedTask.user_id == user_id, ArchivedTask.id.in_(chunk))
+            .returning(ArchivedTask.id, ArchivedTask.priority, ArchivedTask.status)
+        ):
+            deleted.add(task_id)
+            add_delta(delta, task_delta(task_priority, task_status, -1))
+    if deleted:
+        for chunk in _chunks(sorted(deleted)):
+            unindex_tasks(user_id, chunk)
+            sync.record_deletes(user_id, chunk, version)
+        apply_delta(user_id, delta)
+        db.session.commit()
+    else:
+        db.session.rollback()
+
+    results = []
+    for index, task_id in enumerate(items):
+        if not _is_task_id(task_id):
+            results.append({"index": index, "status": 400, "message": "Task ids must be integers"})
+        elif task_id in deleted:
+            results.append({"index": index, "status": 200, "id": task_id})
+        else:
+            results.append({"index": index, "status": 404, "id": task_id, "message": "Task not found"})
+    return _bulk_response(results)
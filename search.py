@@ -0,0 +1,138 @@
+"""Full-text search over task titles and descriptions.
+
+Two interchangeable backends, picked by ``SEARCH_BACKEND`` ("auto" by default):
+
+* ``postgres`` - a stored ``tasks.search_vector`` tsvector column with a GIN index, ranked
+  with ``ts_rank``. The column is generated by the database, so writes need no extra work.
+* ``builtin`` - an inverted index in ``task_terms`` keyed by (user_id, term, task_id) that
+  the task write handlers keep up to date. Used for SQLite and other databases.
+
+Either way a query only touches the posting lists of its terms, not the whole task list.
+"""
+import re
+from collections import Counter
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from sqlalchemy import DDL, event
+from models import Task, TaskTerm, db
+from shards import shard_router
+
+TITLE_WEIGHT = 4
+DESCRIPTION_WEIGHT = 1
+MAX_QUERY_TERMS = 16
+MAX_TERM_LENGTH = 64
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+event.listen(
+    Task.__table__,
+    'after_create',
+    DDL(
+        "ALTER TABLE tasks ADD COLUMN search_vector tsvector GENERATED ALWAYS AS ("
+        "setweight(to_tsvector('english', coalesce(title, '')), 'A') || "
+        "setweight(to_tsvector('english', coalesce(description, '')), 'B')) STORED; "
+        "CREATE INDEX ix_tasks_search_vector ON tasks USING GIN (search_vector)"
+    ).execute_if(dialect='postgresql')
+)
+
+
+def backend():
+    configured = current_app.config.get('SEARCH_BACKEND', 'auto')
+    if configured != 'auto':
+        return configured
+    return 'postgres' if db.engine.dialect.name == 'postgresql' else 'builtin'
+
+
+def tokenize(text):
+    return [token for token in _TOKEN_RE.findall((text or '').lower()) if 1 < len(token) <= MAX_TERM_LENGTH]
+
+
+def _term_rows(user_id, task_id, title, description):
+    weights = Counter()
+    for term in tokenize(title):
+        weights[term] += TITLE_WEIGHT
+    for term in tokenize(description):
+        weights[term] += DESCRIPTION_WEIGHT
+    return [{"user_id": user_id, "term": term, "task_id": task_id, "weight": weight} for term, weight in weights.items()]
+
+
+def unindex_tasks(user_id, task_ids):
+    if task_ids and backend() == 'builtin':
+        db.session.execute(db.delete(TaskTerm).where(TaskTerm.user_id == user_id, TaskTerm.task_id.in_(list(task_ids))))
+
+
+def index_tasks(user_id, tasks, replace=False):
+    """Index ``tasks``, an iterable of (task_id, title, description), in the current transaction.
+
+    Pass ``replace=True`` when the tasks may already be indexed (an edit) to drop their old terms first.
+    """
+    if backend() != 'builtin':
+        return
+    tasks = list(tasks)
+    if replace:
+        unindex_tasks(user_id, [task_id for task_id, _, _ in tasks])
+    rows = [row for task_id, title, description in tasks for row in _term_rows(user_id, task_id, title, description)]
+    if rows:
+        db.session.execute(db.insert(TaskTerm), rows)
+
+
+def search_query(user_id, q, columns):
+    """Select ``columns`` plus a ``score`` for the user's tasks matching every term of ``q``, best first.
+
+    Returns None when ``q`` has no searchable terms.
+    """
+    if backend() == 'postgres':
+        if not tokenize(q):
+            return None
+        tsquery = db.func.plainto_tsquery('english', q)
+        vector = db.literal_column('tasks.search_vector')
+        score = db.func.ts_rank(vector, tsquery)
+        return (
+            db.select(*columns, score.label('score'))
+            .where(Task.user_id == user_id, vector.op('@@')(tsquery))
+            .order_by(score.desc(), Task.id)
+        )
+
+    terms = list(dict.fromkeys(tokenize(q)))[:MAX_QUERY_TERMS]
+    if not terms:
+        return None
+    hits = (
+        db.select(TaskTerm.task_id, db.func.sum(TaskTerm.weight).label('score'))
+        .where(TaskTerm.user_id == user_id, TaskTerm.term.in_(terms))
+        .group_by(TaskTerm.task_id)
+        .having(db.func.count() == len(terms))
+        .subquery()
+    )
+    return (
+        db.select(*columns, hits.c.score)
+        .join(hits, hits.c.task_id == Task.id)
+        .order_by(hits.c.score.desc(), Task.id)
+    )
+
+
+def rebuild(batch_size=1000):
+    """Rebuild the built-in index from the tasks table"""
+    db.session.execute(db.delete(TaskTerm))
+    count = 0
+    result = db.session.execute(
+        db.select(Task.user_id, Task.id, Task.title, Task.description).execution_options(yield_per=batch_size)
+    )
+    for rows in result.partitions():
+        terms = [term for user_id, task_id, title, description in rows
+                 for term in _term_rows(user_id, task_id, title, description)]
+        if terms:
+            db.session.execute(db.insert(TaskTerm), terms)
+        count += len(rows)
+    db.session.commit()
+    return count
+
+
+@click.command('rebuild-search-index')
+@with_appcontext
+def rebuild_search_index_command():
+    """Rebuild the built-in full-text index (not needed with the postgres backend)."""
+    if backend() != 'builtin':
+        click.echo("Search uses the postgres tsvector backend; nothing to rebuild.")
+        return
+    count = sum(rebuild() for _ in shard_router.each_shard())
+    click.echo(f"Indexed {count} task(s).")
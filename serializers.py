@@ -0,0 +1,68 @@
+"""Task serialization shared by the task endpoints.
+
+Listing endpoints select plain column tuples (``db.select(*task_columns(...))``) instead of
+loading ORM objects; single-task endpoints may pass a ``Task`` instance. Payloads are encoded
+with orjson when it is installed and with the stdlib encoder otherwise.
+"""
+import datetime
+import json
+from flask import current_app
+from instrumentation import timed
+from models import Task
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+TASK_FIELDS = ('id', 'title', 'description', 'due_date', 'priority', 'status')
+
+
+def parse_fields(value):
+    """Parse a ``fields=a,b`` sparse fieldset parameter, raising ValueError on unknown names"""
+    if not value:
+        return TASK_FIELDS
+    fields = tuple(dict.fromkeys(name.strip() for name in value.split(',') if name.strip()))
+    unknown = [name for name in fields if name not in TASK_FIELDS]
+    if not fields or unknown:
+        raise ValueError(f"Unknown fields: {', '.join(unknown)}. Allowed: {', '.join(TASK_FIELDS)}")
+    return fields
+
+
+def task_columns(fields=TASK_FIELDS, extra=(), source=Task):
+    """Columns of ``source`` (``Task`` or a subquery's ``.c``) to select for ``fields``.
+
+    ``extra`` columns are appended after them and not serialized.
+    """
+    return [getattr(source, name) for name in dict.fromkeys(fields + tuple(extra))]
+
+
+def task_to_dict(task, fields=TASK_FIELDS):
+    return {name: getattr(task, name) for name in fields}
+
+
+def rows_to_dicts(rows, fields=TASK_FIELDS):
+    """Serialize rows selected with ``task_columns(fields, ...)``"""
+    return [dict(zip(fields, row)) for row in rows]
+
+
+def rows_to_columns(rows, fields=TASK_FIELDS):
+    """Columnar form of rows selected with ``task_columns(fields, ...)``: names once, values as parallel arrays"""
+    return {"fields": list(fields), "columns": [[row[i] for row in rows] for i in range(len(fields))]}
+
+
+def _default(value):
+    if isinstance(value, (datetime.date, datetime.datetime)):
+        return value.isoformat()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def dumps(payload):
+    with timed('serialize'):
+        if orjson is not None:
+            return orjson.dumps(payload)
+        return json.dumps(payload, default=_default, separators=(',', ':')).encode('utf-8')
+
+
+def json_response(payload, status=200):
+    return current_app.response_class(dumps(payload), status=status, mimetype='application/json')
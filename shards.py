@@ -0,0 +1,393 @@
+"""Horizontal sharding of users and their tasks.
+
+With ``SQLALCHEMY_SHARDS`` set (one bind key per shard, see ``DATABASE_SHARD_URLS``), every
+per-user table lives on the user's shard and the default bind only holds the directory:
+``user_shards`` maps each user id and email to a shard, and ``id_blocks`` hands out user
+and task ids that are unique across shards, so a user can move without renumbering.
+
+``db.session`` picks its shard once per session (see db_routing.py): from the request's user
+for authenticated requests, from the email for /register and /login (``use_for_email``), and
+explicitly through ``each_shard`` for maintenance commands. New users are placed by a hash
+of their email. Directory lookups are cached per process for ``SHARD_DIRECTORY_CACHE_TTL``
+seconds, which is also how long ``flask shards move`` waits for those caches to drain
+before copying a user.
+
+Without ``SQLALCHEMY_SHARDS`` everything stays on the default bind and this module is inert.
+"""
+import threading
+import time
+import zlib
+import click
+from flask import current_app, jsonify
+from flask.cli import with_appcontext
+from sqlalchemy.exc import IntegrityError
+from cache import LRUCache
+from models import ArchivedTask, IdBlock, Task, TaskStats, TaskTerm, TaskTombstone, User, UserShard, db
+
+DEFAULT_CACHE_TTL = 30
+DEFAULT_ID_BLOCK_SIZE = 1000
+DIRECTORY_CACHE_SIZE = 100000
+MOVE_CHUNK_SIZE = 1000
+
+# every per-user table with the column holding the user id, parents first
+SHARDED_TABLES = (
+    (User.__table__, User.__table__.c.id),
+    (TaskStats.__table__, TaskStats.__table__.c.user_id),
+    (Task.__table__, Task.__table__.c.user_id),
+    (ArchivedTask.__table__, ArchivedTask.__table__.c.user_id),
+    (TaskTombstone.__table__, TaskTombstone.__table__.c.user_id),
+    (TaskTerm.__table__, TaskTerm.__table__.c.user_id),
+)
+
+
+class UserMoving(Exception):
+    """The user is being copied to another shard"""
+
+
+class UnknownUser(Exception):
+    """The user id is not in the shard directory"""
+
+
+class EmailTaken(Exception):
+    pass
+
+
+class ShardRouter:
+    def __init__(self):
+        self._users = LRUCache(maxsize=DIRECTORY_CACHE_SIZE)
+        self._emails = LRUCache(maxsize=DIRECTORY_CACHE_SIZE)
+        # name -> [next, end) of the id block this process is handing out
+        self._blocks = {}
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        app.config.setdefault('SQLALCHEMY_SHARDS', [])
+        app.config.setdefault('SHARD_DIRECTORY_CACHE_TTL', DEFAULT_CACHE_TTL)
+        app.config.setdefault('SHARD_ID_BLOCK_SIZE', DEFAULT_ID_BLOCK_SIZE)
+        missing = [key for key in app.config['SQLALCHEMY_SHARDS'] if key not in app.config.get('SQLALCHEMY_BINDS', {})]
+        if missing:
+            raise ValueError(f"SQLALCHEMY_SHARDS names unknown binds: {', '.join(missing)}")
+        app.extensions['shard_router'] = self
+        app.register_error_handler(UserMoving, _user_moving)
+        app.register_error_handler(UnknownUser, _unknown_user)
+
+    @property
+    def shards(self):
+        return current_app.config.get('SQLALCHEMY_SHARDS') or []
+
+    def _directory(self):
+        return db.engines[None]
+
+    def _cache_expiry(self):
+        return time.time() + current_app.config.get('SHARD_DIRECTORY_CACHE_TTL', DEFAULT_CACHE_TTL)
+
+    def placement(self, email):
+        """Shard for a new user"""
+        return self.shards[zlib.crc32(email.lower().encode('utf-8')) % len(self.shards)]
+
+    def shard_for_user(self, user_id):
+        shard = self._users.get(user_id)
+        if shard is None:
+            with self._directory().connect() as conn:
+                row = conn.execute(
+                    db.select(UserShard.shard, UserShard.moving).where(UserShard.user_id == user_id)
+                ).first()
+            if row is None:
+                raise UnknownUser(user_id)
+            if row.moving:
+                raise UserMoving(user_id)
+            shard = row.shard
+            self._users.set(user_id, shard, expires_at=self._cache_expiry())
+        return shard
+
+    def lookup_email(self, email):
+        """``(user_id, shard)`` for a registered email, else None"""
+        entry = self._emails.get(email)
+        if entry is None:
+            with self._directory().connect() as conn:
+                row = conn.execute(
+                    db.select(UserShard.user_id, UserShard.shard, UserShard.moving).where(UserShard.email == email)
+                ).first()
+            if row is None:
+                return None
+            if row.moving:
+                raise UserMoving(row.user_id)
+            entry = (row.user_id, row.shard)
+            self._emails.set(email, entry, expires_at=self._cache_expiry())
+        return entry
+
+    def use_for_email(self, email):
+        """Point db.session at the shard that holds (or would hold) ``email``"""
+        if self.shards:
+            entry = self.lookup_email(email)
+            db.session.info['shard'] = entry[1] if entry else self.placement(email)
+
+    def register(self, email):
+        """Reserve a user id for ``email`` on the session's shard; None when unsharded.
+
+        Raises EmailTaken if the email is already in the directory. Call ``unregister`` if
+        the user is not committed after all.
+        """
+        if not self.shards:
+            return None
+        user_id = self.allocate_ids('users', 1)[0]
+        try:
+            with self._directory().begin() as conn:
+                conn.execute(db.insert(UserShard).values(user_id=user_id, email=email, shard=db.session.info['shard']))
+        except IntegrityError:
+            raise EmailTaken(email)
+        return user_id
+
+    def unregister(self, user_id):
+        with self._directory().begin() as conn:
+            conn.execute(db.delete(UserShard).where(UserShard.user_id == user_id))
+
+    def allocate_ids(self, name, count):
+        """``count`` ids unique across shards for ``name`` ("users" or "tasks"); None when unsharded"""
+        if not self.shards:
+            return None
+        ids = []
+        while True:
+            with self._lock:
+                next_id, end = self._blocks.get(name, (0, 0))
+                take = min(count - len(ids), end - next_id)
+                ids.extend(range(next_id, next_id + take))
+                self._blocks[name] = (next_id + take, end)
+            if len(ids) == count:
+                return ids
+            # not under the lock: under asgi.py the query yields to other requests on this thread
+            block = self._reserve_block(name, max(count - len(ids), current_app.config['SHARD_ID_BLOCK_SIZE']))
+            with self._lock:
+                # a concurrent refill may be replaced; its unused ids are simply skipped
+                self._blocks[name] = block
+
+    def _reserve_block(self, name, size):
+        with self._directory().begin() as conn:
+            end = conn.execute(
+                db.update(IdBlock).where(IdBlock.name == name).values(next_id=IdBlock.next_id + size)
+                .returning(IdBlock.next_id)
+            ).scalar()
+        if end is None:
+            raise RuntimeError("id_blocks is empty; run `flask shards init-directory` first")
+        return end - size, end
+
+    def each_shard(self):
+        """Point db.session at each shard in turn (at the default bind once when unsharded)"""
+        for key in self.shards or [None]:
+            db.session.close()
+            db.session.info['shard'] = key
+            try:
+                yield key
+            finally:
+                db.session.close()
+                db.session.info.pop('shard', None)
+
+    def forget(self, user_ids=None):
+        """Drop cached directory entries (all of them when ``user_ids`` is None)"""
+        self._emails.clear()
+        if user_ids is None:
+            self._users.clear()
+            with self._lock:
+                self._blocks.clear()
+        else:
+            for user_id in user_ids:
+                self._users.pop(user_id)
+
+
+shard_router = ShardRouter()
+
+
+def _user_moving(error):
+    return jsonify(message="Account is being moved, please retry"), 503, {"Retry-After": "5"}
+
+
+def _unknown_user(error):
+    return jsonify(message="User not found"), 404
+
+
+def init_directory(create_tables=False):
+    """Fill the directory from the users already on each shard; returns how many were added"""
+    directory = db.engines[None]
+    if create_tables:
+        db.metadata.create_all(directory)
+        for key in shard_router.shards:
+            db.metadata.create_all(db.engines[key])
+    added, max_user_id, max_task_id = 0, 0, 0
+    with directory.begin() as dconn:
+        known = set(dconn.execute(db.select(UserShard.user_id)).scalars())
+        for key in shard_router.shards:
+            with db.engines[key].connect() as conn:
+                users = conn.execute(db.select(User.id, User.email)).all()
+                max_task_id = max(
+                    max_task_id,
+                    conn.execute(db.select(db.func.max(Task.id))).scalar() or 0,
+                    conn.execute(db.select(db.func.max(ArchivedTask.id))).scalar() or 0,
+                )
+            rows = [{"user_id": user_id, "email": email, "shard": key} for user_id, email in users if user_id not in known]
+            if rows:
+                dconn.execute(db.insert(UserShard), rows)
+            added += len(rows)
+            max_user_id = max([max_user_id] + [user_id for user_id, _ in users])
+        for name, floor in (('users', max_user_id + 1), ('tasks', max_task_id + 1)):
+            current = dconn.execute(db.select(IdBlock.next_id).where(IdBlock.name == name)).scalar()
+            if current is None:
+                dconn.execute(db.insert(IdBlock).values(name=name, next_id=floor))
+            elif current < floor:
+                dconn.execute(db.update(IdBlock).where(IdBlock.name == name).values(next_id=floor))
+    shard_router.forget()
+    return added
+
+
+def move_users(user_ids, target, drain_seconds=None):
+    """Move users to shard ``target``; returns the ids actually moved.
+
+    The users are marked as moving (their requests get a 503), the directory caches are
+    given ``drain_seconds`` to expire, then the rows are copied, the directory switched and
+    the source rows deleted. Leftovers of an interrupted move are replaced on the next one.
+    """
+    if target not in shard_router.shards:
+        raise ValueError(f"Unknown shard {target!r}")
+    if drain_seconds is None:
+        drain_seconds = current_app.config.get('SHARD_DIRECTORY_CACHE_TTL', DEFAULT_CACHE_TTL)
+    directory = db.engines[None]
+    with directory.begin() as conn:
+        marked = conn.execute(
+            db.update(UserShard)
+            .where(UserShard.user_id.in_(list(user_ids)), UserShard.shard != target, UserShard.moving == db.false())
+            .values(moving=True).returning(UserShard.user_id, UserShard.shard)
+        ).all()
+    if not marked:
+        return []
+    by_source = {}
+    for user_id, source in marked:
+        by_source.setdefault(source, []).append(user_id)
+    time.sleep(drain_seconds)
+
+    moved = []
+    for source, ids in by_source.items():
+        try:
+            _copy_users(ids, db.engines[source], db.engines[target])
+        except Exception:
+            with directory.begin() as conn:
+                conn.execute(db.update(UserShard).where(UserShard.user_id.in_(ids)).values(moving=False))
+            raise
+        with directory.begin() as conn:
+            conn.execute(db.update(UserShard).where(UserShard.user_id.in_(ids)).values(shard=target, moving=False))
+        with db.engines[source].begin() as conn:
+            _delete_users(conn, ids)
+        moved.extend(ids)
+    shard_router.forget(moved)
+    return moved
+
+
+def _delete_users(conn, user_ids):
+    for table, user_column in reversed(SHARDED_TABLES):
+        conn.execute(db.delete(table).where(user_column.in_(user_ids)))
+
+
+def _copy_users(user_ids, source, target):
+    with source.connect() as sconn, target.begin() as tconn:
+        _delete_users(tconn, user_ids)
+        for table, user_column in SHARDED_TABLES:
+            result = sconn.execute(
+                db.select(table).where(user_column.in_(user_ids)).execution_options(yield_per=MOVE_CHUNK_SIZE)
+            )
+            for rows in result.partitions():
+                tconn.execute(db.insert(table), [row._asdict() for row in rows])
+
+
+def plan_rebalance():
+    """Moves ``[(user_id, source, target)]`` that even out the number of users per shard"""
+    if not shard_router.shards:
+        return []
+    with db.engines[None].connect() as conn:
+        counts = dict(conn.execute(db.select(UserShard.shard, db.func.count()).group_by(UserShard.shard)).all())
+        counts = {key: counts.get(key, 0) for key in shard_router.shards}
+        # an even split: every shard gets the floor of the mean and the fullest ``remainder``
+        # shards one more, so a shard above its share always has somewhere to send users
+        base, remainder = divmod(sum(counts.values()), len(counts))
+        by_size = sorted(counts, key=lambda key: counts[key], reverse=True)
+        targets = {key: base + (1 if rank < remainder else 0) for rank, key in enumerate(by_size)}
+        moves = []
+        under = [key for key in by_size if counts[key] < targets[key]]
+        for source in [key for key in by_size if counts[key] > targets[key]]:
+            surplus = counts[source] - targets[source]
+            # newest users first: they tend to have the fewest tasks to copy
+            user_ids = conn.execute(
+                db.select(UserShard.user_id).where(UserShard.shard == source)
+                .order_by(UserShard.user_id.desc()).limit(surplus)
+            ).scalars().all()
+            for user_id in user_ids:
+                while under and counts[under[0]] >= targets[under[0]]:
+                    under.pop(0)
+                if not under:
+                    break
+                moves.append((user_id, source, under[0]))
+                counts[under[0]] += 1
+                counts[source] -= 1
+    return moves
+
+
+@click.group('shards')
+def shards_cli():
+    """Manage the shard directory and move users between shards."""
+
+
+@shards_cli.command('status')
+@with_appcontext
+def status_command():
+    """Show how many users each shard holds."""
+    if not shard_router.shards:
+        raise click.ClickException("SQLALCHEMY_SHARDS is not configured")
+    with db.engines[None].connect() as conn:
+        counts = dict(conn.execute(db.select(UserShard.shard, db.func.count()).group_by(UserShard.shard)).all())
+    for key in shard_router.shards:
+        click.echo(f"{key}: {counts.get(key, 0)} user(s)")
+
+
+@shards_cli.command('init-directory')
+@click.option('--create-tables', is_flag=True, help='Also create missing tables on the directory and every shard.')
+@with_appcontext
+def init_directory_command(create_tables):
+    """Register users already on the shards and seed the id allocator."""
+    if not shard_router.shards:
+        raise click.ClickException("SQLALCHEMY_SHARDS is not configured")
+    click.echo(f"Added {init_directory(create_tables)} user(s) to the directory.")
+
+
+@shards_cli.command('move')
+@click.argument('user_ids', type=int, nargs=-1, required=True)
+@click.option('--to', 'target', required=True, help='Bind key of the destination shard.')
+@click.option('--drain-seconds', type=float, default=None, help='Wait for directory caches (default: SHARD_DIRECTORY_CACHE_TTL).')
+@with_appcontext
+def move_command(user_ids, target, drain_seconds):
+    """Move users to another shard."""
+    if not shard_router.shards:
+        raise click.ClickException("SQLALCHEMY_SHARDS is not configured")
+    moved = move_users(user_ids, target, drain_seconds)
+    click.echo(f"Moved {len(moved)} user(s) to {target}.")
+
+
+@shards_cli.command('rebalance')
+@click.option('--batch-size', type=int, default=100, help='Users moved per drain period.')
+@click.option('--limit', type=int, default=None, help='Move at most this many users.')
+@click.option('--dry-run', is_flag=True, help='Only print the plan.')
+@click.option('--drain-seconds', type=float, default=None, help='Wait for directory caches (default: SHARD_DIRECTORY_CACHE_TTL).')
+@with_appcontext
+def rebalance_command(batch_size, limit, dry_run, drain_seconds):
+    """Even out the number of users per shard."""
+    if not shard_router.shards:
+        raise click.ClickException("SQLALCHEMY_SHARDS is not configured")
+    moves = plan_rebalance()[:limit]
+    if dry_run:
+        for user_id, source, target in moves:
+            click.echo(f"user {user_id}: {source} -> {target}")
+        return
+    by_target = {}
+    for user_id, _, target in moves:
+        by_target.setdefault(target, []).append(user_id)
+    total = 0
+    for target, user_ids in by_target.items():
+        for start in range(0, len(user_ids), batch_size):
+            total += len(move_users(user_ids[start:start + batch_size], target, drain_seconds))
+    click.echo(f"Moved {total} user(s).")
@@ -0,0 +1,113 @@
+"""Incrementally maintained per-user task statistics.
+
+Every task write adds a delta to the user's ``task_stats`` row in the same transaction, so
+``GET /tasks/stats`` reads one row instead of counting the task list. Only "overdue" depends
+on today's date; it is a range count on the (user_id, status, due_date) index and so scales
+with the number of overdue tasks, not with the whole list. ``flask rebuild-task-stats``
+recomputes the counters from ``tasks`` to repair drift.
+"""
+import datetime
+import click
+from flask.cli import with_appcontext
+from models import ArchivedTask, Task, TaskStats, User, PRIORITY_RANKS, db
+from shards import shard_router
+
+COUNTERS = ('total', 'completed', 'high', 'medium', 'low')
+
+
+def task_delta(priority, status, sign=1):
+    """Counter changes for adding (sign=1) or removing (sign=-1) one task"""
+    delta = {'total': sign}
+    if status:
+        delta['completed'] = sign
+    if priority in PRIORITY_RANKS:
+        delta[priority.lower()] = sign
+    return delta
+
+
+def add_delta(total, delta):
+    for name, amount in delta.items():
+        total[name] = total.get(name, 0) + amount
+    return total
+
+
+def _all_tasks():
+    """Hot and archived tasks; archived ones still count"""
+    return db.union_all(
+        db.select(Task.id, Task.user_id, Task.status, Task.priority),
+        db.select(ArchivedTask.id, ArchivedTask.user_id, ArchivedTask.status, ArchivedTask.priority)
+    ).subquery('all_tasks')
+
+
+def _counter_columns(tasks):
+    columns = [db.func.count(tasks.c.id)]
+    columns.append(db.func.coalesce(db.func.sum(db.case((tasks.c.status == db.true(), 1), else_=0)), 0))
+    for priority in PRIORITY_RANKS:
+        columns.append(db.func.coalesce(db.func.sum(db.case((tasks.c.priority == priority, 1), else_=0)), 0))
+    return columns
+
+
+def count_tasks(user_id):
+    """Counters computed from the task tables (includes unflushed changes via autoflush)"""
+    tasks = _all_tasks()
+    row = db.session.execute(db.select(*_counter_columns(tasks)).where(tasks.c.user_id == user_id)).one()
+    return dict(zip(COUNTERS, row))
+
+
+def apply_delta(user_id, delta):
+    """Add ``delta`` to the user's counters inside the current transaction"""
+    changes = {name: getattr(TaskStats, name) + amount for name, amount in delta.items() if amount}
+    if not changes:
+        return
+    result = db.session.execute(
+        db.update(TaskStats).where(TaskStats.user_id == user_id).values(**changes),
+        execution_options={"synchronize_session": False}
+    )
+    if result.rowcount == 0:
+        # no counters yet (e.g. created before the table existed): seed them from the tasks,
+        # which already include this transaction's change
+        db.session.add(TaskStats(user_id=user_id, **count_tasks(user_id)))
+
+
+def get_stats(user_id):
+    row = db.session.execute(
+        db.select(*[getattr(TaskStats, name) for name in COUNTERS]).where(TaskStats.user_id == user_id)
+    ).first()
+    counters = dict(zip(COUNTERS, row)) if row else count_tasks(user_id)
+    overdue = db.session.scalar(
+        db.select(db.func.count()).select_from(Task).where(
+            Task.user_id == user_id,
+            Task.status == db.false(),
+            Task.due_date < datetime.date.today()
+        )
+    )
+    return {
+        "total": counters['total'],
+        "completed": counters['completed'],
+        "pending": counters['total'] - counters['completed'],
+        "overdue": overdue,
+        "by_priority": {priority: counters[priority.lower()] for priority in PRIORITY_RANKS}
+    }
+
+
+def rebuild(user_ids=None):
+    """Recompute counters from the task tables for ``user_ids`` (all users when None)"""
+    delete = db.delete(TaskStats)
+    tasks = _all_tasks()
+    select = db.select(User.id, *_counter_columns(tasks)).outerjoin(tasks, tasks.c.user_id == User.id).group_by(User.id)
+    if user_ids:
+        delete = delete.where(TaskStats.user_id.in_(user_ids))
+        select = select.where(User.id.in_(user_ids))
+    db.session.execute(delete)
+    result = db.session.execute(db.insert(TaskStats).from_select(('user_id',) + COUNTERS, select))
+    db.session.commit()
+    return result.rowcount
+
+
+@click.command('rebuild-task-stats')
+@click.option('--user-id', 'user_ids', type=int, multiple=True, help='Only rebuild these users (repeatable).')
+@with_appcontext
+def rebuild_task_stats_command(user_ids):
+    """Recompute task_stats from the tasks and tasks_archive tables."""
+    count = sum(rebuild(list(user_ids) or None) for _ in shard_router.each_shard())
+    click.echo(f"Rebuilt task stats for {count} user(s).")
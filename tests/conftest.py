@@ -0,0 +1,74 @@
+import pytest
+from app import create_app
+from models import TaskStats, User, db
+from shards import init_directory, shard_router
+from stats import COUNTERS, count_tasks
+
+TEST_CONFIG = {
+    'SQLALCHEMY_DATABASE_URI': 'sqlite://',
+    'SQLALCHEMY_BINDS': {},
+    'SWAGGER_UI': False,
+    'JWT_SECRET_KEY': 'test-secret-key-long-enough-for-hs256',
+    'PASSWORD_HASH_WORKERS': 0,
+}
+
+
+@pytest.fixture
+def app():
+    app = create_app(TEST_CONFIG)
+    with app.app_context():
+        db.create_all()
+        yield app
+        db.session.remove()
+        db.drop_all()
+
+
+@pytest.fixture
+def sharded_app(request, tmp_path):
+    """SQLite shards (two, or as many as the indirect parameter says) behind a directory database"""
+    count = getattr(request, 'param', 2)
+    shards = {f'shard_{i}': f"sqlite:///{tmp_path / f'shard_{i}.db'}" for i in range(count)}
+    app = create_app(dict(
+        TEST_CONFIG,
+        SQLALCHEMY_DATABASE_URI=f"sqlite:///{tmp_path / 'directory.db'}",
+        SQLALCHEMY_BINDS=shards,
+        SQLALCHEMY_SHARDS=list(shards),
+        SHARD_DIRECTORY_CACHE_TTL=0,
+    ))
+    with app.app_context():
+        init_directory(create_tables=True)
+        yield app
+        db.session.remove()
+        for engine in db.engines.values():
+            engine.dispose()
+    # init_app registered a metadata per bind on the shared db; later apps have no such binds
+    for key in shards:
+        db.metadatas.pop(key, None)
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def login(client):
+    """``login(email)`` registers the user and returns their auth headers"""
+    def login(email='a@b.com'):
+        client.post('/register', json={'username': 'u', 'email': email, 'password': 'secret1'})
+        response = client.post('/login', json={'email': email, 'password': 'secret1'})
+        return {'Authorization': 'Bearer ' + response.json['access_token']}
+    return login
+
+
+@pytest.fixture
+def counters_match():
+    """``counters_match()`` checks every user's task_stats row against a recount of their tasks"""
+    def counters_match():
+        for shard in shard_router.each_shard():
+            for user_id in db.session.scalars(db.select(User.id)).all():
+                stored = db.session.get(TaskStats, user_id)
+                assert stored is not None, (shard, user_id)
+                assert {name: getattr(stored, name) for name in COUNTERS} == count_tasks(user_id), (shard, user_id)
+        return True
+    return counters_match
@@ -0,0 +1,88 @@
+import json
+import pytest
+import archive
+from models import ArchivedTask, Task, User, db
+
+
+@pytest.fixture
+def headers(client, login):
+    headers = login()
+    for i, (due_date, status) in enumerate([
+        ('2020-01-01', True), ('2020-01-02', True), ('2020-01-03', True), ('2020-01-04', False), ('2099-01-01', True),
+    ]):
+        client.post('/tasks', headers=headers, json={
+            'title': f'task {i}', 'due_date': due_date, 'priority': ['High', 'Low'][i % 2], 'status': status,
+        })
+    assert archive.archive(days=30) == 3
+    return headers
+
+
+def _archived_ids():
+    return set(db.session.scalars(db.select(ArchivedTask.id)))
+
+
+def _version():
+    return db.session.scalar(db.select(User.data_version))
+
+
+def test_get_task_falls_back_to_the_archive(client, headers):
+    task_id = min(_archived_ids())
+    response = client.get(f'/tasks/{task_id}', headers=headers)
+    assert response.status_code == 200
+    assert response.json['id'] == task_id and response.json['status'] is True
+    assert client.get('/tasks/999', headers=headers).status_code == 404
+
+
+def test_updating_an_archived_task_is_a_conflict(client, headers):
+    task_id = min(_archived_ids())
+    response = client.put(f'/tasks/{task_id}', headers=headers, json={'title': 'renamed'})
+    assert response.status_code == 409
+    response = client.put(f'/tasks/{task_id}', headers=headers, json={'status': False})
+    assert response.status_code == 409
+    assert client.put('/tasks/999', headers=headers, json={'status': False}).status_code == 404
+
+    response = client.put('/tasks/bulk', headers=headers, json=[{'id': task_id, 'status': False}, {'id': 999}])
+    assert [result['status'] for result in response.json['results']] == [409, 404]
+    assert task_id in _archived_ids()
+
+
+def test_deleting_an_archived_task(client, headers, counters_match):
+    task_id = min(_archived_ids())
+    total = client.get('/tasks/stats', headers=headers).json['total']
+    version = _version()
+
+    assert client.delete(f'/tasks/{task_id}', headers=headers).status_code == 200
+    assert task_id not in _archived_ids()
+    assert client.get(f'/tasks/{task_id}', headers=headers).status_code == 404
+    assert client.get('/tasks/stats', headers=headers).json['total'] == total - 1
+    assert _version() > version
+    assert counters_match()
+    changes = client.get('/tasks/changes', headers=headers).json
+    assert task_id not in [task['id'] for task in changes['tasks']]
+
+
+def test_bulk_delete_covers_hot_and_archived_tasks(client, headers, counters_match):
+    archived = sorted(_archived_ids())
+    hot = db.session.scalar(db.select(Task.id).where(Task.status == db.false()))
+    total = client.get('/tasks/stats', headers=headers).json['total']
+
+    response = client.delete('/tasks/bulk', headers=headers, json=archived[:2] + [hot, 999])
+    assert [result['status'] for result in response.json['results']] == [200, 200, 200, 404]
+    assert _archived_ids() == set(archived[2:])
+    assert client.get('/tasks/stats', headers=headers).json['total'] == total - 3
+    assert counters_match()
+
+
+def test_export_includes_archived_tasks_on_request(client, headers):
+    def exported(**params):
+        response = client.get('/tasks/export', headers=headers, query_string=params)
+        assert response.status_code == 200
+        return {json.loads(line)['id'] for line in response.data.splitlines()}
+
+    hot = exported()
+    everything = exported(include_archived='true')
+    assert len(hot) == 2 and len(everything) == 5
+    assert everything - hot == _archived_ids()
+    open_task = db.session.scalar(db.select(Task.id).where(Task.status == db.false()))
+    assert exported(include_archived='true', status='true') == everything - {open_task}
+    assert client.get('/tasks/export', headers=headers, query_string={'include_archived': 'x'}).status_code == 400
@@ -0,0 +1,86 @@
+import pytest
+from sqlalchemy import event
+from models import Task, db
+from routes.tasks import MAX_BULK_SIZE
+
+
+def _task(title, status=False):
+    return {'title': title, 'due_date': '2030-01-01', 'priority': 'High', 'status': status}
+
+
+@pytest.fixture
+def headers(login):
+    return login()
+
+
+def _statuses(response):
+    assert response.status_code == 200
+    return [result['status'] for result in response.json['results']]
+
+
+def test_bulk_create_reports_each_item(client, headers):
+    response = client.post('/tasks/bulk', headers=headers, json=[
+        _task('a'), 'not an object', dict(_task('b'), due_date='tomorrow'), dict(_task('c'), priority='Urgent'), _task('d'),
+    ])
+    assert _statuses(response) == [201, 400, 400, 400, 201]
+    assert [result['index'] for result in response.json['results']] == [0, 1, 2, 3, 4]
+    assert (response.json['succeeded'], response.json['failed']) == (2, 3)
+    created = [result['id'] for result in response.json['results'] if result['status'] == 201]
+    assert [db.session.get(Task, task_id).title for task_id in created] == ['a', 'd']
+
+
+def test_bulk_create_keeps_ids_in_item_order(client, headers):
+    client.post('/tasks', headers=headers, json=_task('first'))
+    client.delete('/tasks/1', headers=headers)
+    response = client.post('/tasks/bulk', headers=headers, json=[_task(f'task {i}') for i in range(50)])
+    ids = [result['id'] for result in response.json['results']]
+    assert 1 not in ids
+    assert [db.session.get(Task, task_id).title for task_id in ids] == [f'task {i}' for i in range(50)]
+
+
+def test_bulk_create_does_not_insert_row_by_row(app, client, headers):
+    statements = []
+    event.listen(db.engine, 'before_cursor_execute', lambda *args: statements.append(args[2]))
+    response = client.post('/tasks/bulk', headers=headers, json=[_task(f'task {i}') for i in range(100)])
+    assert response.json['succeeded'] == 100
+    assert sum(statement.lstrip().upper().startswith('INSERT INTO TASKS') for statement in statements) == 1
+    assert len(statements) < 10
+
+
+def test_bulk_update_reports_each_item(client, headers):
+    ids = [result['id'] for result in client.post('/tasks/bulk', headers=headers, json=[_task('a'), _task('b')]).json['results']]
+    response = client.put('/tasks/bulk', headers=headers, json=[
+        {'id': ids[0], 'status': True}, {'status': True}, {'id': 'x'}, {'id': 999, 'status': True},
+        {'id': ids[1], 'due_date': 'never'}, {'id': ids[1], 'title': 'renamed'},
+    ])
+    assert _statuses(response) == [200, 400, 400, 404, 400, 200]
+    assert db.session.get(Task, ids[0]).status is True
+    assert db.session.get(Task, ids[1]).title == 'renamed'
+
+
+def test_bulk_delete_reports_each_item(client, headers):
+    ids = [result['id'] for result in client.post('/tasks/bulk', headers=headers, json=[_task('a'), _task('b')]).json['results']]
+    response = client.delete('/tasks/bulk', headers=headers, json=[ids[0], 'x', 999, ids[1], True])
+    assert _statuses(response) == [200, 400, 404, 200, 400]
+    assert db.session.scalar(db.select(db.func.count()).select_from(Task)) == 0
+
+
+def test_bulk_tasks_of_another_user_are_not_found(client, login, headers):
+    ids = [result['id'] for result in client.post('/tasks/bulk', headers=headers, json=[_task('mine')]).json['results']]
+    other = login('c@d.com')
+    assert _statuses(client.put('/tasks/bulk', headers=other, json=[{'id': ids[0], 'status': True}])) == [404]
+    assert _statuses(client.delete('/tasks/bulk', headers=other, json=ids)) == [404]
+
+
+@pytest.mark.parametrize('method', ['post', 'put', 'delete'])
+@pytest.mark.parametrize('body', [[], {'id': 1}, 'tasks', None])
+def test_bulk_body_must_be_a_non_empty_array(client, headers, method, body):
+    response = getattr(client, method)('/tasks/bulk', headers=headers, json=body)
+    assert response.status_code == 400
+
+
+@pytest.mark.parametrize('method', ['post', 'put', 'delete'])
+def test_bulk_item_cap(client, headers, method):
+    response = getattr(client, method)('/tasks/bulk', headers=headers, json=[1] * (MAX_BULK_SIZE + 1))
+    assert response.status_code == 400
+    assert str(MAX_BULK_SIZE) in response.json['message']
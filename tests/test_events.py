@@ -0,0 +1,31 @@
+import datetime
+from models import Task, User, db
+from events import stream
+
+
+def _write_elsewhere(user_id):
+    """Create a task the way another worker process would: this process's broker never hears of it"""
+    with db.engine.begin() as conn:
+        version = conn.scalar(
+            db.update(User).where(User.id == user_id).values(data_version=User.data_version + 1).returning(User.data_version)
+        )
+        conn.execute(db.insert(Task).values(
+            title='elsewhere', due_date=datetime.date(2030, 1, 1), priority='High', status=False,
+            user_id=user_id, version=version, created_version=version,
+        ))
+    return version
+
+
+def test_memory_channel_picks_up_other_processes_on_heartbeat(app, login):
+    login()
+    app.config.update(EVENTS_CHANNEL='memory', EVENTS_HEARTBEAT_SECONDS=0.01)
+    user_id = db.session.scalar(db.select(User.id))
+    events = stream(user_id, 0)
+    assert next(events) == b"retry: 3000\n\n"
+    assert next(events) == b": keep-alive\n\n"
+
+    version = _write_elsewhere(user_id)
+    event = next(events)
+    assert event.startswith(b"event: created\n" + f"id: {version}\n".encode('ascii'))
+    assert b'"elsewhere"' in event
+    events.close()
@@ -0,0 +1,88 @@
+import datetime
+import threading
+import pytest
+from models import Task, User, db, priority_rank
+from routes.tasks import task_creates
+
+
+def _row(user_id, title):
+    return {
+        'title': title, 'description': None, 'due_date': datetime.date(2030, 1, 1),
+        'priority': 'High', 'priority_rank': priority_rank('High'), 'status': False, 'user_id': user_id,
+    }
+
+
+@pytest.fixture
+def users(app, login):
+    for email in ('a@b.com', 'c@d.com', 'e@f.com'):
+        login(email)
+    return db.session.scalars(db.select(User.id).order_by(User.id)).all()
+
+
+def _submit_together(app, rows):
+    """Submit ``rows`` from one thread each so they land in a single batch; returns results or errors"""
+    app.config.update(GROUP_COMMIT_MAX_BATCH=len(rows), GROUP_COMMIT_MAX_WAIT_MS=5000)
+    outcomes = [None] * len(rows)
+
+    def submit(i):
+        with app.app_context():
+            try:
+                outcomes[i] = task_creates.submit(rows[i])
+            except Exception as e:
+                outcomes[i] = e
+
+    # the leader writes through the shared in-memory connection; nothing else may hold it open
+    db.session.remove()
+    threads = [threading.Thread(target=submit, args=(i,)) for i in range(len(rows))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(10)
+    return outcomes
+
+
+def _versions():
+    return dict(db.session.execute(db.select(User.id, User.data_version)).all())
+
+
+def test_batch_of_several_users_commits_once(app, users, counters_match):
+    before_versions = _versions()
+    before_batches = task_creates.stats()['batches']
+    rows = [_row(user_id, f'task {user_id}.{i}') for user_id in users for i in range(2)]
+
+    outcomes = _submit_together(app, rows)
+    assert all(isinstance(task_id, int) for task_id in outcomes)
+    assert len(set(outcomes)) == len(rows)
+    assert task_creates.stats()['batches'] == before_batches + 1
+
+    for row, task_id in zip(rows, outcomes):
+        task = db.session.get(Task, task_id)
+        assert (task.user_id, task.title) == (row['user_id'], row['title'])
+    versions = _versions()
+    for user_id in users:
+        assert versions[user_id] == before_versions[user_id] + 1
+        tasks = db.session.scalars(db.select(Task).where(Task.user_id == user_id)).all()
+        assert {(task.version, task.created_version) for task in tasks} == {(versions[user_id], versions[user_id])}
+    assert counters_match()
+
+
+def test_failing_item_fails_only_its_caller(app, users, counters_match):
+    before_versions = _versions()
+    before_batches = task_creates.stats()['batches']
+    bad_user = users[-1]
+    rows = [_row(user_id, f'task {user_id}') for user_id in users[:-1] for _ in range(2)]
+    rows.insert(1, _row(bad_user, None))
+
+    outcomes = _submit_together(app, rows)
+    assert isinstance(outcomes[1], Exception)
+    succeeded = outcomes[:1] + outcomes[2:]
+    assert all(isinstance(task_id, int) for task_id in succeeded)
+    assert task_creates.stats()['batches'] == before_batches + 1
+    assert sorted(db.session.scalars(db.select(Task.id))) == sorted(succeeded)
+    versions = _versions()
+    # each good item was retried in a transaction of its own; the failed one left no trace
+    assert versions[bad_user] == before_versions[bad_user]
+    for user_id in users[:-1]:
+        assert versions[user_id] == before_versions[user_id] + 2
+    assert db.session.scalar(db.select(db.func.count()).select_from(Task).where(Task.user_id == bad_user)) == 0
+    assert counters_match()
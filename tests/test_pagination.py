@@ -0,0 +1,63 @@
+import base64
+import json
+import pytest
+
+
+def _cursor(payload):
+    raw = json.dumps(payload).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+@pytest.fixture
+def headers(client, login):
+    headers = login()
+    for i in range(5):
+        client.post('/tasks', headers=headers, json={
+            'title': f'task {i}', 'due_date': f'2030-01-0{i % 3 + 1}',
+            'priority': ['High', 'Medium', 'Low'][i % 3], 'status': False,
+        })
+    return headers
+
+
+@pytest.mark.parametrize('sort_by', ['due_date', 'priority'])
+def test_cursor_pages_through_every_task_once(client, headers, sort_by):
+    seen = []
+    cursor = None
+    while True:
+        query = {'sort_by': sort_by, 'limit': 2}
+        if cursor:
+            query['cursor'] = cursor
+        response = client.get('/tasks', headers=headers, query_string=query)
+        assert response.status_code == 200
+        seen += [task['id'] for task in response.json['tasks']]
+        cursor = response.json['next_cursor']
+        if cursor is None:
+            break
+    assert sorted(seen) == sorted(set(seen))
+    assert len(seen) == 5
+
+
+@pytest.mark.parametrize('cursor', [
+    'not base64!',
+    _cursor('x'),
+    _cursor(['due_date', 'asc']),
+    _cursor(['due_date', 'asc', 5]),
+    _cursor(['due_date', 'asc', [None, 1, 1]]),
+    _cursor(['due_date', 'asc', ['2030-01-01', 1]]),
+    _cursor(['due_date', 'asc', ['2030-13-01', 1, 1]]),
+    _cursor(['due_date', 'asc', ['2030-01-01', '1', 1]]),
+    _cursor(['due_date', 'asc', ['2030-01-01', True, 1]]),
+    _cursor(['due_date', 'asc', {'a': 1}]),
+    _cursor(['priority', 'asc', [1, 1]]),
+])
+def test_malformed_cursor_is_rejected(client, headers, cursor):
+    response = client.get('/tasks', headers=headers, query_string={'cursor': cursor})
+    assert response.status_code == 400
+    assert response.json == {'message': 'Invalid cursor'}
+
+
+def test_priority_cursor_shape_is_checked(client, headers):
+    for values in ([1], [1, None], ['1', 1], 7):
+        cursor = _cursor(['priority', 'asc', values])
+        response = client.get('/tasks', headers=headers, query_string={'sort_by': 'priority', 'cursor': cursor})
+        assert response.status_code == 400
@@ -0,0 +1,53 @@
+import datetime
+from models import Task, db
+from reminders import ReminderScheduler
+
+NOW = datetime.datetime(2030, 1, 1, 12)
+
+
+class Sink:
+    def __init__(self, fail=False):
+        self.fail = fail
+        self.batches = []
+
+    def send(self, reminders):
+        # the claim is committed before the sink runs, so no row lock is held meanwhile
+        assert not db.session().in_transaction()
+        self.batches.append(reminders)
+        if self.fail:
+            raise OSError("sink unavailable")
+
+
+def _tasks(client, login):
+    headers = login()
+    client.post('/tasks/bulk', headers=headers, json=[
+        {'title': f'task {i}', 'due_date': '2030-01-02', 'priority': 'High', 'status': False} for i in range(3)
+    ])
+    return sorted(db.session.scalars(db.select(Task.id)))
+
+
+def _reminded():
+    return set(db.session.scalars(db.select(Task.id).where(Task.reminded_for.is_not(None))))
+
+
+def test_reminders_are_sent_once(client, login):
+    task_ids = _tasks(client, login)
+    sink = Sink()
+    scheduler = ReminderScheduler(sink, batch_size=2)
+    assert scheduler.tick(NOW) == 3
+    assert [len(batch) for batch in sink.batches] == [2, 1]
+    assert sorted(reminder['task_id'] for batch in sink.batches for reminder in batch) == task_ids
+    assert _reminded() == set(task_ids)
+    assert ReminderScheduler(sink).tick(NOW) == 0
+
+
+def test_failed_send_releases_the_claim(client, login):
+    task_ids = _tasks(client, login)
+    sink = Sink(fail=True)
+    assert ReminderScheduler(sink).tick(NOW) == 0
+    assert len(sink.batches) == 1
+    assert _reminded() == set()
+
+    sink.fail = False
+    assert ReminderScheduler(sink).tick(NOW) == 3
+    assert _reminded() == set(task_ids)
@@ -0,0 +1,45 @@
+import pytest
+from sqlalchemy import event
+from models import db
+
+
+def _task(title, description=''):
+    return {'title': title, 'description': description, 'due_date': '2030-01-01', 'priority': 'High', 'status': False}
+
+
+@pytest.fixture
+def headers(login):
+    return login()
+
+
+def _found(client, headers, q):
+    response = client.get('/tasks/search', headers=headers, query_string={'q': q})
+    assert response.status_code == 200
+    return sorted(task['id'] for task in response.json['tasks'])
+
+
+@pytest.fixture
+def statements(app):
+    statements = []
+    event.listen(db.engine, 'before_cursor_execute', lambda *args: statements.append(args[2].lstrip().upper()))
+    return statements
+
+
+def test_creating_tasks_does_not_unindex(client, headers, statements):
+    client.post('/tasks', headers=headers, json=_task('water plants'))
+    client.post('/tasks/bulk', headers=headers, json=[_task('water lawn'), _task('buy seeds', 'for the lawn')])
+    assert not [statement for statement in statements if statement.startswith('DELETE FROM TASK_TERMS')]
+    assert len(_found(client, headers, 'water')) == 2
+    assert len(_found(client, headers, 'lawn')) == 2
+
+
+def test_edits_replace_the_old_terms(client, headers):
+    task_ids = [result['id'] for result in client.post('/tasks/bulk', headers=headers, json=[
+        _task('water plants'), _task('buy seeds'),
+    ]).json['results']]
+
+    assert client.put(f'/tasks/{task_ids[0]}', headers=headers, json={'title': 'feed cat'}).status_code == 200
+    client.put('/tasks/bulk', headers=headers, json=[{'id': task_ids[1], 'description': 'tomato'}])
+    assert _found(client, headers, 'water') == []
+    assert _found(client, headers, 'feed cat') == [task_ids[0]]
+    assert _found(client, headers, 'seeds tomato') == [task_ids[1]]
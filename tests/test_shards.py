@@ -0,0 +1,84 @@
+import pytest
+from models import ArchivedTask, Task, TaskStats, TaskTombstone, User, UserShard, db
+from shards import move_users, plan_rebalance, shard_router
+
+
+def _rows(key, model, user_id):
+    with db.engines[key].connect() as conn:
+        return sorted(tuple(row) for row in conn.execute(db.select(model).filter_by(user_id=user_id)))
+
+
+def _place(counts):
+    """Put ``counts[i]`` made-up users on shard i of the directory"""
+    shards = [key for key, count in zip(shard_router.shards, counts) for _ in range(count)]
+    if shards:
+        with db.engines[None].begin() as conn:
+            conn.execute(db.insert(UserShard), [
+                {'user_id': user_id, 'email': f'{user_id}@example.com', 'shard': key}
+                for user_id, key in enumerate(shards, 1)
+            ])
+
+
+def _directory():
+    with db.engines[None].connect() as conn:
+        return {row.user_id: row for row in conn.execute(db.select(UserShard))}
+
+
+@pytest.mark.parametrize('sharded_app, counts, expected_moves', [
+    (3, [2, 2, 0], 1),
+    (3, [0, 2, 2], 1),
+    (3, [3, 0, 0], 2),
+    (3, [5, 0, 0], 3),
+    (3, [4, 1, 1], 2),
+    (3, [2, 1, 1], 0),
+    (3, [0, 0, 0], 0),
+    (2, [3, 1], 1),
+    (2, [3, 2], 0),
+], indirect=['sharded_app'])
+def test_plan_rebalance_evens_out_users(sharded_app, counts, expected_moves):
+    _place(counts)
+    moves = plan_rebalance()
+    assert len(moves) == expected_moves
+    placement = {user_id: entry.shard for user_id, entry in _directory().items()}
+    sizes = dict(zip(shard_router.shards, counts))
+    for user_id, source, target in moves:
+        assert placement[user_id] == source != target
+        sizes[source] -= 1
+        sizes[target] += 1
+    assert max(sizes.values()) - min(sizes.values()) <= 1
+    assert len({user_id for user_id, _, _ in moves}) == len(moves)
+
+
+def test_move_users_takes_everything_along(sharded_app):
+    client = sharded_app.test_client()
+    client.post('/register', json={'username': 'u', 'email': 'a@b.com', 'password': 'secret1'})
+    token = client.post('/login', json={'email': 'a@b.com', 'password': 'secret1'}).json['access_token']
+    headers = {'Authorization': 'Bearer ' + token}
+    response = client.post('/tasks/bulk', headers=headers, json=[
+        {'title': f'task {i}', 'due_date': f'203{i}-01-01', 'priority': 'High', 'status': i % 2 == 0} for i in range(4)
+    ])
+    task_ids = [result['id'] for result in response.json['results']]
+    assert client.delete(f'/tasks/{task_ids[0]}', headers=headers).status_code == 200
+
+    user_id, source = shard_router.lookup_email('a@b.com')
+    target = next(key for key in shard_router.shards if key != source)
+    before = {model: _rows(source, model, user_id) for model in (Task, TaskStats, TaskTombstone, ArchivedTask)}
+    assert before[Task] and before[TaskStats] and before[TaskTombstone]
+
+    assert move_users([user_id], target, drain_seconds=0) == [user_id]
+    for model, rows in before.items():
+        assert _rows(target, model, user_id) == rows
+        assert _rows(source, model, user_id) == []
+    with db.engines[target].connect() as conn:
+        assert conn.scalar(db.select(User.email).where(User.id == user_id)) == 'a@b.com'
+    with db.engines[source].connect() as conn:
+        assert conn.scalar(db.select(User.id).where(User.id == user_id)) is None
+    entry = _directory()[user_id]
+    assert (entry.shard, entry.moving) == (target, False)
+    assert shard_router.lookup_email('a@b.com') == (user_id, target)
+
+    # the user carries on where they left off; the test client's requests share the fixture's
+    # app context, so drop its session, which is still pinned to the old shard
+    db.session.remove()
+    assert sorted(task['id'] for task in client.get('/tasks', headers=headers).json) == task_ids[1:]
+    assert move_users([user_id], target, drain_seconds=0) == []
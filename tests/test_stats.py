@@ -0,0 +1,99 @@
+import archive
+from models import Task, db
+from shards import move_users, shard_router
+
+
+def _task(title, priority='High', status=False, due_date='2030-01-01'):
+    return {'title': title, 'due_date': due_date, 'priority': priority, 'status': status}
+
+
+def _stats(client, headers):
+    response = client.get('/tasks/stats', headers=headers)
+    assert response.status_code == 200
+    return response.json
+
+
+def test_counters_follow_single_task_writes(client, login, counters_match):
+    headers = login()
+    statuses = [client.post('/tasks', headers=headers, json=_task(f't{i}', priority)).status_code
+                for i, priority in enumerate(['High', 'Medium', 'Low'])]
+    assert statuses == [201, 201, 201]
+    assert counters_match()
+    task_id, other_id = db.session.scalars(db.select(Task.id).order_by(Task.id)).all()[:2]
+
+    assert client.put(f'/tasks/{task_id}', headers=headers, json={'status': True}).status_code == 200
+    assert counters_match()
+    assert client.put(f'/tasks/{task_id}', headers=headers, json={'priority': 'Low'}).status_code == 200
+    assert counters_match()
+    assert client.put(f'/tasks/{task_id}', headers=headers, json={'priority': 'Medium', 'status': False}).status_code == 200
+    assert client.put(f'/tasks/{task_id}', headers=headers, json={'title': 'renamed'}).status_code == 200
+    assert counters_match()
+    assert client.delete(f'/tasks/{other_id}', headers=headers).status_code == 200
+    assert counters_match()
+
+    stats = _stats(client, headers)
+    assert stats['total'] == 2
+
+
+def test_counters_follow_bulk_writes(client, login, counters_match):
+    headers = login()
+    response = client.post('/tasks/bulk', headers=headers, json=[
+        _task(f't{i}', ['High', 'Medium', 'Low'][i % 3], i % 2 == 0) for i in range(12)
+    ] + [{'title': 'bad date', 'due_date': 'soon', 'priority': 'High', 'status': False}])
+    assert response.json['succeeded'] == 12
+    assert counters_match()
+    ids = db.session.scalars(db.select(Task.id).order_by(Task.id)).all()
+
+    # the same task twice in one batch, and a change back and forth
+    response = client.put('/tasks/bulk', headers=headers, json=[
+        {'id': ids[0], 'status': True}, {'id': ids[0], 'priority': 'Low'}, {'id': ids[1], 'status': False},
+        {'id': ids[2], 'priority': 'High'}, {'id': ids[2], 'priority': 'Medium'}, {'id': 999, 'status': True},
+    ])
+    assert response.json['succeeded'] == 5
+    assert counters_match()
+
+    response = client.delete('/tasks/bulk', headers=headers, json=ids[:5] + [999])
+    assert response.json['succeeded'] == 5
+    assert counters_match()
+    assert _stats(client, headers)['total'] == 7
+
+
+def test_counters_survive_archiving(client, login, counters_match):
+    headers = login()
+    client.post('/tasks/bulk', headers=headers, json=[
+        _task('old done', status=True, due_date='2020-01-01'), _task('old open', due_date='2020-01-01'), _task('new'),
+    ])
+    before = _stats(client, headers)
+    assert archive.archive(days=30) == 1
+    assert counters_match()
+    after = _stats(client, headers)
+    assert (after['total'], after['completed']) == (before['total'], before['completed'])
+
+
+def test_counters_of_several_users_stay_apart(client, login, counters_match):
+    first, second = login('a@b.com'), login('c@d.com')
+    client.post('/tasks/bulk', headers=first, json=[_task('a'), _task('b', status=True)])
+    client.post('/tasks', headers=second, json=_task('c', 'Low'))
+    assert counters_match()
+    assert _stats(client, first)['total'] == 2
+    assert _stats(client, second)['total'] == 1
+
+
+def test_counters_move_with_the_user(sharded_app, counters_match):
+    client = sharded_app.test_client()
+    client.post('/register', json={'username': 'u', 'email': 'a@b.com', 'password': 'secret1'})
+    token = client.post('/login', json={'email': 'a@b.com', 'password': 'secret1'}).json['access_token']
+    headers = {'Authorization': 'Bearer ' + token}
+    client.post('/tasks/bulk', headers=headers, json=[_task('a'), _task('b', 'Low', True), _task('c', 'Medium')])
+    before = _stats(client, headers)
+
+    user_id, source = shard_router.lookup_email('a@b.com')
+    target = next(key for key in shard_router.shards if key != source)
+    assert move_users([user_id], target, drain_seconds=0) == [user_id]
+    assert counters_match()
+    assert _stats(client, headers) == before
+
+    client.put('/tasks/bulk', headers=headers, json=[{'id': task['id'], 'status': True}
+                                                     for task in client.get('/tasks', headers=headers).json])
+    assert counters_match()
+    assert _stats(client, headers)['completed'] == 3
@@ -1,16 +1,67 @@
 from flask import request, jsonify, current_app
 import datetime
+import hashlib
 import jwt
 from functools import wraps
+from cache import LRUCache
+from instrumentation import timed
+from models import User, db
+from shards import shard_router
 
+USER_ID_CACHE_SIZE = 10000
+USER_ID_CACHE_TTL = 300
+TOKEN_CACHE_SIZE = 10000
 
-def create_access_token(identity, expires_delta=None):
+
+# email -> user id, only consulted for tokens issued before the "uid" claim existed
+_user_ids_by_email = LRUCache(maxsize=USER_ID_CACHE_SIZE, ttl=USER_ID_CACHE_TTL)
+
+
+# sha256(token) -> verified payload, evicted at the token's own "exp".
+# Entries outlive a JWT_SECRET_KEY change, so call clear_token_cache() when rotating it.
+_verified_tokens = LRUCache(maxsize=TOKEN_CACHE_SIZE)
+
+
+def _decode_token(token):
+    """Return the token payload, verifying the signature only on a cache miss"""
+    digest = hashlib.sha256(token.encode('utf-8')).digest()
+    payload = _verified_tokens.get(digest)
+    if payload is None:
+        payload = jwt.decode(token, current_app.config['JWT_SECRET_KEY'], algorithms=["HS256"])
+        _verified_tokens.set(digest, payload, expires_at=payload.get("exp"))
+    return payload
+
+
+def token_cache_stats():
+    return _verified_tokens.stats()
+
+
+def clear_token_cache():
+    _verified_tokens.clear()
+
+
+def _resolve_user_id(email):
+    user_id = _user_ids_by_email.get(email)
+    if user_id is None and email is not None:
+        if shard_router.shards:
+            entry = shard_router.lookup_email(email)
+            user_id = entry[0] if entry else None
+        else:
+            user_id = db.session.query(User.id).filter_by(email=email).scalar()
+        if user_id is not None:
+            _user_ids_by_email.set(email, user_id)
+    return user_id
+
+
+def create_access_token(identity, expires_delta=None, user_id=None):
     expire = datetime.datetime.utcnow() + (expires_delta if expires_delta else current_app.config['JWT_ACCESS_TOKEN_EXPIRES'])
     payload = {
         "sub": identity,
         "iat": datetime.datetime.utcnow(),
         "exp": expire
     }
+    if user_id is not None:
+        payload["uid"] = user_id
     token = jwt.encode(payload, current_app.config['JWT_SECRET_KEY'], algorithm="HS256")
     if isinstance(token, bytes):
         token = token.decode('utf-8')
@@ -25,16 +76,22 @@ def jwt_required(fn):
 
         token = auth_header.split(" ")[1]
         try:
-            payload = jwt.decode(token, current_app.config['JWT_SECRET_KEY'], algorithms=["HS256"])
+            with timed('jwt'):
+                payload = _decode_token(token)
             request.user_identity = payload.get("sub")
+            request.user_id = payload.get("uid")
         except jwt.ExpiredSignatureError:
             return jsonify({"msg": "Token expired"}), 401
         except jwt.InvalidTokenError:
             return jsonify({"msg": "Invalid token"}), 401
-        
+
+        if request.user_id is None:
+            request.user_id = _resolve_user_id(request.user_identity)
         return fn(*args, **kwargs)
     return wrapper
 
 def get_jwt_identity():
     return getattr(request, "user_identity", None)
 
+def get_jwt_user_id():
+    return getattr(request, "user_id", None)